@@ -0,0 +1,172 @@
+#!/usr/bin/python3
+
+import pandas as pd
+
+import instrumentation
+
+# Precomputed aggregate tables for the frequent read queries (statistics per
+# genre and year, filmographies of the actors, keyword co-occurrences and a
+# search document per movie). They are built from the loaded frames while the
+# import runs: every aggregate table is built as soon as the tables it is
+# computed from have passed and is loaded like the other tables.
+
+# tables every aggregate table is computed from
+ANALYTICS_INPUTS = {
+    'genre_year_stats': ['movies', 'movies_genres'],
+    'actor_filmographies': ['movies', 'actors'],
+    'actor_genre_counts': ['actors', 'movies_genres'],
+    'keyword_cooccurrences': ['movies_keywords'],
+    'movie_search_documents': ['movies', 'movies_keywords', 'keywords']
+}
+ANALYTICS_TABLES = list(ANALYTICS_INPUTS.keys())
+
+# the search documents are searched with
+# to_tsvector('english', document) @@ to_tsquery('english', ...)
+ANALYTICS_INDEXES = {
+    'movie_search_documents':
+    'CREATE INDEX IF NOT EXISTS movie_search_documents_document_idx ON '
+    + "movie_search_documents USING gin (to_tsvector('english', document));"
+}
+
+
+# Returns the release year of every movie, NA if the date is missing.
+def get_release_years(movies):
+    return pd.to_numeric(movies['release_date'].str[:4],
+                         errors='coerce').astype('Int64')
+
+
+def get_movie_facts(movies):
+    return pd.DataFrame({
+        'movie_id': movies['id'],
+        'year': get_release_years(movies),
+        'rating': movies['rating'],
+        'rating_count': movies['rating_count'],
+        'runtime': movies['runtime'],
+        'budget': movies['budget'],
+        'revenue': movies['revenue']
+    })
+
+
+def get_actor_movies(actors):
+    return actors[['person_id', 'movie_id']].drop_duplicates()
+
+
+# Number of movies, ratings, mean rating and runtime and the summed budget and
+# revenue per genre and release year. Movies without release date are not
+# counted.
+def get_genre_year_stats(movies, movies_genres):
+    facts = movies_genres[['movie_id', 'genre_id']].merge(
+        get_movie_facts(movies), on='movie_id').dropna(subset=['year'])
+    grouped = facts.groupby(['genre_id', 'year'])
+    return pd.DataFrame({
+        'movie_count': grouped['movie_id'].count(),
+        'rating_count': grouped['rating_count'].sum(),
+        'avg_rating': grouped['rating'].mean(),
+        'avg_runtime': grouped['runtime'].mean(),
+        # NULL if the budget (revenue) of no movie of the group is known
+        'total_budget': grouped['budget'].sum(min_count=1),
+        'total_revenue': grouped['revenue'].sum(min_count=1)
+    }).reset_index()
+
+
+# Number of movies, first and last release year and mean rating of the movies
+# of every actor.
+def get_actor_filmographies(movies, actors):
+    facts = get_actor_movies(actors).merge(get_movie_facts(movies),
+                                           on='movie_id')
+    grouped = facts.groupby('person_id')
+    return pd.DataFrame({
+        'movie_count': grouped['movie_id'].count(),
+        'first_year': grouped['year'].min(),
+        'last_year': grouped['year'].max(),
+        'avg_rating': grouped['rating'].mean()
+    }).reset_index()
+
+
+# Number of movies of every actor per genre.
+def get_actor_genre_counts(actors, movies_genres):
+    pairs = get_actor_movies(actors).merge(
+        movies_genres[['movie_id', 'genre_id']].drop_duplicates(),
+        on='movie_id')
+    return pairs.groupby(['person_id', 'genre_id']).size().rename(
+        'movie_count').reset_index()
+
+
+# Number of movies for every pair of keywords which are assigned to the same
+# movie; every pair is stored once with keyword_id < other_keyword_id.
+def get_keyword_cooccurrences(movies_keywords):
+    assignments = movies_keywords[['movie_id', 'keyword_id']].drop_duplicates()
+    pairs = assignments.merge(assignments.rename(
+        columns={'keyword_id': 'other_keyword_id'}),
+                              on='movie_id')
+    pairs = pairs[pairs['keyword_id'] < pairs['other_keyword_id']]
+    return pairs.groupby(['keyword_id', 'other_keyword_id']).size().rename(
+        'movie_count').reset_index()
+
+
+# Title, overview and keywords of every movie as one text.
+def get_movie_search_documents(movies, movies_keywords, keywords):
+    assignments = movies_keywords[['movie_id', 'keyword_id']].merge(
+        keywords[['id', 'keyword']].rename(columns={'id': 'keyword_id'}),
+        on='keyword_id')
+    # the grouped sum concatenates the strings without a python call per
+    # movie
+    movie_keywords = (assignments['keyword'] + ' ').groupby(
+        assignments['movie_id']).sum().str.rstrip()
+    documents = (movies['title'].fillna('') + ' '
+                 + movies['overview'].fillna('') + ' '
+                 + movies['id'].map(movie_keywords).fillna(''))
+    return pd.DataFrame({
+        'movie_id': movies['id'],
+        'title': movies['title'],
+        'document': documents.str.strip()
+    })
+
+
+ANALYTICS_BUILDERS = {
+    'genre_year_stats': get_genre_year_stats,
+    'actor_filmographies': get_actor_filmographies,
+    'actor_genre_counts': get_actor_genre_counts,
+    'keyword_cooccurrences': get_keyword_cooccurrences,
+    'movie_search_documents': get_movie_search_documents
+}
+
+
+# Returns the statements which create the indexes of the aggregate tables of
+# schema_info.
+def get_index_statements(schema_info):
+    return [(table, statement)
+            for table, statement in ANALYTICS_INDEXES.items()
+            if table in schema_info]
+
+
+# Passes on the tables (pairs of table name and DataFrame) and yields every
+# aggregate table of schema_info after the tables it is computed from. The
+# frames of the input tables are only kept until the last aggregate table
+# which needs them is built.
+def iterate_analytics_tables(tables, schema_info):
+    pending = {
+        table: inputs
+        for table, inputs in ANALYTICS_INPUTS.items() if table in schema_info
+    }
+    frames = dict()
+    for table, frame in tables:
+        yield table, frame
+        if any([table in inputs for inputs in pending.values()]):
+            frames[table] = frame
+        ready = [
+            name for name, inputs in pending.items()
+            if all([input_table in frames for input_table in inputs])
+        ]
+        for name in ready:
+            inputs = pending.pop(name)
+            with instrumentation.stage('build ' + name) as record:
+                result = ANALYTICS_BUILDERS[name](
+                    *[frames[input_table] for input_table in inputs])
+                record['rows_out'] = len(result)
+            print('Built %d rows of %s' % (len(result), name))
+            yield name, result
+        for input_table in list(frames.keys()):
+            if not any(
+                [input_table in inputs for inputs in pending.values()]):
+                del frames[input_table]
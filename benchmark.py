@@ -0,0 +1,479 @@
+#!/usr/bin/python3
+
+import sys
+import os
+import csv
+import json
+import time
+import random
+import platform
+import subprocess
+from collections import namedtuple
+
+import pandas as pd
+
+import loader
+import analytics
+import bulk_writer
+import csv_reader
+import integrity
+import instrumentation
+
+HELP_TEXT = (
+    'USAGE: \033[1mbenchmark.py\033[0m [--scales s1,s2,...] [--sink s] '
+    + '[--engine e] [--data-dir path] [--output file]\n'
+    + '\t--scales: comma separated scales of the synthetic dataset '
+    + '(default: 1,10,100)\n'
+    + '\t--sink: null (discard the rows in process, default) or postgres '
+    + '(database from db_config.json, all tables are recreated!)\n'
+    + '\t--engine: write engine (default: ' + bulk_writer.DEFAULT_ENGINE
+    + ')\n'
+    + '\t--data-dir: folder for the generated files (default: benchmark_data)\n'
+    + '\t--output: file for the JSON results (default: print to stdout)')
+
+OPTIONS = ['scales', 'sink', 'engine', 'data-dir', 'output']
+
+SINK_NULL = 'null'
+SINK_POSTGRES = 'postgres'
+
+DEFAULT_SCALES = '1,10,100'
+DEFAULT_DATA_DIR = 'benchmark_data'
+
+# size of the synthetic dataset at scale 1
+BASE_MOVIES = 1000
+BASE_PERSONS = 5000
+BASE_KEYWORDS = 1000
+BASE_COMPANIES = 200
+BASE_COLLECTIONS = 50
+BASE_USERS = 2000
+BASE_RATINGS = 100000
+
+SEED = 42
+
+GENRES = [(28, 'Action'), (12, 'Adventure'), (16, 'Animation'),
+          (35, 'Comedy'), (80, 'Crime'), (99, 'Documentary'), (18, 'Drama'),
+          (10751, 'Family'), (14, 'Fantasy'), (36, 'History'),
+          (27, 'Horror'), (10402, 'Music'), (9648, 'Mystery'),
+          (10749, 'Romance'), (878, 'Science Fiction'), (53, 'Thriller'),
+          (10752, 'War'), (37, 'Western')]
+LANGUAGES = [('en', 'English'), ('fr', 'Français'), ('de', 'Deutsch'),
+             ('es', 'Español'), ('it', 'Italiano'), ('ja', '日本語'),
+             ('ru', 'Pусский'), ('zh', '普通话'), ('hi', 'हिन्दी'),
+             ('sv', 'svenska'), ('xx', 'No Language')]
+COUNTRIES = [('US', 'United States of America'), ('GB', 'United Kingdom'),
+             ('FR', 'France'), ('DE', 'Germany'), ('IT', 'Italy'),
+             ('JP', 'Japan'), ('CA', 'Canada'), ('IN', 'India'),
+             ('ES', 'Spain'), ('RU', 'Russia'), ('CN', 'China'),
+             ('SE', 'Sweden')]
+JOBS = [('Directing', 'Director'), ('Writing', 'Screenplay'),
+        ('Writing', 'Writer'), ('Writing', 'Novel'),
+        ('Production', 'Producer'), ('Production', 'Executive Producer'),
+        ('Production', 'Casting'), ('Sound', 'Original Music Composer'),
+        ('Camera', 'Director of Photography'), ('Editing', 'Editor'),
+        ('Art', 'Production Design'), ('Costume & Make-Up',
+                                       'Costume Design')]
+SYLLABLES = ['ka', 'lo', 'mi', 'ra', 'ten', 'su', 'vo', 'dan', 'el', 'ri',
+             'ost', 'ma', 'ne', 'jo', 'ul', "o'b", 'ar', 'zé']
+
+MOVIE_COLUMNS = [
+    'adult', 'belongs_to_collection', 'budget', 'genres', 'homepage', 'id',
+    'imdb_id', 'original_language', 'original_title', 'overview',
+    'popularity', 'poster_path', 'production_companies',
+    'production_countries', 'release_date', 'revenue', 'runtime',
+    'spoken_languages', 'status', 'tagline', 'title', 'video',
+    'vote_average', 'vote_count'
+]
+
+Column = namedtuple('Column', ['type_code'])
+
+
+# Cursor which accepts all writes of the write engines and discards them, so
+# the load of the tables can be measured without a database.
+class NullCursor:
+    def __init__(self):
+        self.description = None
+        self.rows = 0
+        self.bytes = 0
+
+    def execute(self, query, args=None):
+        # column description for the type lookup of the binary engine
+        if query.startswith('SELECT ') and ' FROM ' in query:
+            columns = query[len('SELECT '):query.index(' FROM ')].split(',')
+            self.description = [Column(None) for column in columns]
+
+    def executemany(self, query, rows):
+        self.rows += len(rows)
+
+    def copy_expert(self, query, stream):
+        self.bytes += len(stream.read())
+
+
+class NullConnection:
+    def commit(self):
+        return
+
+    def close(self):
+        return
+
+
+def get_name(rnd, words):
+    return ' '.join([
+        ''.join([rnd.choice(SYLLABLES) for j in range(rnd.randint(2, 3))
+                 ]).capitalize() for i in range(words)
+    ])
+
+
+def get_text(rnd, words):
+    return ' '.join([
+        ''.join([rnd.choice(SYLLABLES) for j in range(rnd.randint(1, 3))])
+        for i in range(words)
+    ])
+
+
+def get_movie_row(rnd, movie_id, scale):
+    collection = ''
+    if rnd.random() < 0.3:
+        collection_id = rnd.randint(1, BASE_COLLECTIONS * scale)
+        collection = repr({
+            'id': collection_id,
+            'name': get_name(rnd, 2) + ' Collection',
+            'poster_path': '/' + get_text(rnd, 1) + '.jpg',
+            'backdrop_path': None
+        })
+    language = rnd.choice(LANGUAGES)
+    return {
+        'adult': 'False',
+        'belongs_to_collection': collection,
+        'budget': rnd.choice([0, rnd.randint(10000, 200000000)]),
+        'genres': repr([{'id': genre_id, 'name': name}
+                        for genre_id, name in rnd.sample(
+                            GENRES, rnd.randint(0, 3))]),
+        'homepage': 'http://example.com/' + str(movie_id),
+        'id': movie_id,
+        'imdb_id': 'tt%07d' % (movie_id,),
+        'original_language': language[0],
+        'original_title': get_name(rnd, rnd.randint(1, 4)),
+        'overview': get_text(rnd, rnd.randint(0, 60)),
+        'popularity': round(rnd.random() * 50, 6),
+        'poster_path': '/' + get_text(rnd, 1) + '.jpg',
+        'production_companies': repr([
+            {'name': get_name(rnd, 2), 'id': company_id}
+            for company_id in rnd.sample(
+                range(1, BASE_COMPANIES * scale + 1), rnd.randint(0, 3))
+        ]),
+        'production_countries': repr([
+            {'iso_3166_1': code, 'name': name}
+            for code, name in rnd.sample(COUNTRIES, rnd.randint(0, 2))
+        ]),
+        'release_date': '%d-%02d-%02d' % (rnd.randint(1900, 2017),
+                                          rnd.randint(1, 12),
+                                          rnd.randint(1, 28)),
+        'revenue': rnd.choice([0, rnd.randint(10000, 900000000)]),
+        'runtime': rnd.choice(['', float(rnd.randint(60, 200))]),
+        'spoken_languages': repr([
+            {'iso_639_1': code, 'name': name}
+            for code, name in [language] + rnd.sample(
+                LANGUAGES, rnd.randint(0, 2))
+        ]),
+        'status': 'Released',
+        'tagline': get_text(rnd, rnd.randint(0, 8)),
+        'title': get_name(rnd, rnd.randint(1, 4)),
+        'video': 'False',
+        'vote_average': round(rnd.random() * 10, 1),
+        'vote_count': rnd.randint(0, 10000)
+    }
+
+
+def get_person(rnd, person_names, scale):
+    person_id = rnd.randint(1, BASE_PERSONS * scale)
+    if not person_id in person_names:
+        person_names[person_id] = get_name(rnd, 2)
+    return person_id, person_names[person_id]
+
+
+def get_credits_row(rnd, movie_id, person_names, scale):
+    cast = []
+    for order in range(rnd.randint(0, 20)):
+        person_id, name = get_person(rnd, person_names, scale)
+        cast.append({
+            'cast_id': order + 1,
+            'character': get_name(rnd, 1),
+            'credit_id': '%024x' % (rnd.getrandbits(96),),
+            'gender': rnd.randint(0, 2),
+            'id': person_id,
+            'name': name,
+            'order': order,
+            'profile_path': rnd.choice([None, '/' + get_text(rnd, 1) + '.jpg'])
+        })
+    crew = []
+    for i in range(rnd.randint(0, 30)):
+        person_id, name = get_person(rnd, person_names, scale)
+        department, job = rnd.choice(JOBS)
+        crew.append({
+            'credit_id': '%024x' % (rnd.getrandbits(96),),
+            'department': department,
+            'gender': rnd.randint(0, 2),
+            'id': person_id,
+            'job': job,
+            'name': name,
+            'profile_path': rnd.choice([None, '/' + get_text(rnd, 1) + '.jpg'])
+        })
+    return {'cast': repr(cast), 'crew': repr(crew), 'id': movie_id}
+
+
+def get_keywords_row(rnd, movie_id, keyword_names, scale):
+    keywords = []
+    for keyword_id in rnd.sample(range(1, BASE_KEYWORDS * scale + 1),
+                                 rnd.randint(0, 10)):
+        if not keyword_id in keyword_names:
+            keyword_names[keyword_id] = get_text(rnd, rnd.randint(1, 2))
+        keywords.append({'id': keyword_id, 'name': keyword_names[keyword_id]})
+    return {'id': movie_id, 'keywords': repr(keywords)}
+
+
+# Writes movies_metadata.csv, credits.csv, keywords.csv, ratings.csv and
+# links.csv with the same columns and cell formats as the Kaggle dataset. Like
+# in the dataset, the ratings use MovieLens movie ids which are mapped to the
+# TMDB ids by the links, and a few links have no TMDB id.
+def generate_dataset(path, scale):
+    rnd = random.Random(SEED)
+    os.makedirs(path, exist_ok=True)
+    movie_ids = rnd.sample(range(1, BASE_MOVIES * scale * 10),
+                           BASE_MOVIES * scale)
+    person_names = dict()
+    keyword_names = dict()
+
+    movies_file = open(os.path.join(path, loader.MOVIES), 'w', newline='')
+    credits_file = open(os.path.join(path, loader.CREDITS), 'w', newline='')
+    keywords_file = open(os.path.join(path, loader.KEYWORDS), 'w', newline='')
+    movies_writer = csv.DictWriter(movies_file, MOVIE_COLUMNS)
+    credits_writer = csv.DictWriter(credits_file, ['cast', 'crew', 'id'])
+    keywords_writer = csv.DictWriter(keywords_file, ['id', 'keywords'])
+    movies_writer.writeheader()
+    credits_writer.writeheader()
+    keywords_writer.writeheader()
+    for i, movie_id in enumerate(movie_ids):
+        row = get_movie_row(rnd, movie_id, scale)
+        # the original file contains a few rows with broken ids
+        if i % 1000 == 999:
+            row['id'] = row['release_date']
+        movies_writer.writerow(row)
+        credits_writer.writerow(
+            get_credits_row(rnd, movie_id, person_names, scale))
+        keywords_writer.writerow(
+            get_keywords_row(rnd, movie_id, keyword_names, scale))
+    movies_file.close()
+    credits_file.close()
+    keywords_file.close()
+
+    links_file = open(os.path.join(path, loader.LINKS), 'w', newline='')
+    links_writer = csv.writer(links_file)
+    links_writer.writerow(['movieId', 'imdbId', 'tmdbId'])
+    movielens_ids = list(range(1, len(movie_ids) + 1))
+    for movielens_id, movie_id in zip(movielens_ids, movie_ids):
+        links_writer.writerow([
+            movielens_id,
+            str(rnd.randint(1, 9999999)).zfill(7),
+            movie_id if movielens_id % 100 != 0 else ''
+        ])
+    links_file.close()
+
+    ratings_file = open(os.path.join(path, loader.RATINGS), 'w', newline='')
+    ratings_writer = csv.writer(ratings_file)
+    ratings_writer.writerow(['userId', 'movieId', 'rating', 'timestamp'])
+    for i in range(BASE_RATINGS * scale):
+        ratings_writer.writerow([
+            rnd.randint(1, BASE_USERS * scale),
+            rnd.choice(movielens_ids),
+            rnd.randint(1, 10) / 2,
+            rnd.randint(789652009, 1501829870)
+        ])
+    ratings_file.close()
+    return
+
+
+def get_git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Runs function(*args), appends the time to the stages and returns the result.
+def run_stage(stages, name, function, *args):
+    print('Run', name, '...')
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    result = function(*args)
+    stages.append({
+        'stage': name,
+        'wall_time': time.perf_counter() - start_wall,
+        'cpu_time': time.process_time() - start_cpu
+    })
+    return result
+
+
+def get_frame_bytes(frame):
+    return int(frame.memory_usage(deep=True).sum())
+
+
+# Reads a file with the default reader of pandas (all columns, inferred types)
+# and with the typed reader of the loader, which is given as function with its
+# arguments. The time and the memory of the frame of both are added to the
+# stages; the typed frame is returned.
+def compare_readers(stages, name, path, read_typed, *args):
+    df = run_stage(stages, 'read_csv ' + name, pd.read_csv, path)
+    stages[-1]['frame_bytes'] = get_frame_bytes(df)
+    typed = run_stage(stages, 'read_typed ' + name, read_typed, *args)
+    stages[-1]['frame_bytes'] = get_frame_bytes(typed)
+    return typed
+
+
+# Reads the whole credits file like the loader reads each of its byte ranges.
+def read_credit_frame(credits_path):
+    return loader.drop_invalid_ids(
+        csv_reader.read_csv('credits', credits_path,
+                            loader.CREDIT_CSV_DTYPES))
+
+
+def run_benchmark(path, scale, sink, engine_name):
+    stages = []
+    # the stages of the loader (e.g. load and flush of every table) are
+    # recorded per run
+    instrumentation.start_run()
+    movies_path = os.path.join(path, loader.MOVIES)
+    credits_path = os.path.join(path, loader.CREDITS)
+    keywords_path = os.path.join(path, loader.KEYWORDS)
+    ratings_path = os.path.join(path, loader.RATINGS)
+    links_path = os.path.join(path, loader.LINKS)
+
+    # the extraction uses the frames of the typed reader like the loader
+    df_movies = compare_readers(stages, 'movies', movies_path,
+                                loader.read_movie_frame, movies_path)
+    df_credits = compare_readers(stages, 'credits', credits_path,
+                                 read_credit_frame, credits_path)
+    df_keywords = compare_readers(stages, 'keywords', keywords_path,
+                                  loader.read_keyword_frame, keywords_path)
+    df_ratings = compare_readers(stages, 'ratings', ratings_path,
+                                 csv_reader.read_csv, 'ratings', ratings_path,
+                                 loader.RATING_DTYPES)
+
+    movie_data = run_stage(stages, 'extract_movie_data',
+                           loader.extract_movie_data, df_movies)
+    credits_data = run_stage(stages, 'extract_credits_data',
+                             loader.extract_credits_data, df_credits)
+    keywords_data = run_stage(stages, 'extract_keyword_data',
+                              loader.extract_keyword_data, df_keywords)
+    rating_data = run_stage(stages, 'extract_rating_data',
+                            loader.extract_rating_data, df_ratings)
+    run_stage(stages, 'stream_rating_data', loader.stream_rating_data,
+              ratings_path, loader.DEFAULT_RATINGS_CHUNK_SIZE)
+    links = run_stage(stages, 'read_links', loader.read_links, links_path)
+
+    f_db_config = open(loader.DB_CONFIG_PATH, 'r')
+    db_config = json.loads(f_db_config.read())
+    f_db_config.close()
+    batch_size = db_config['batch_size']
+    write = bulk_writer.create_write_engine(engine_name)
+
+    # the tables of the extracted files, without the optional raw ratings and
+    # aggregate tables
+    schema_file = open(loader.TABLE_SCHEMA_FILE, 'r')
+    schema_info = json.load(schema_file)
+    schema_file.close()
+    for table in loader.RAW_RATING_TABLES + analytics.ANALYTICS_TABLES:
+        schema_info.pop(table, None)
+
+    # the tables are built and checked like in the loader, with new entity
+    # codes
+    extracted_data = [('movies', movie_data), ('credits', credits_data),
+                      ('keywords', keywords_data), ('ratings', rating_data),
+                      ('links', {
+                          'extracted_links': links
+                      })]
+    tables = run_stage(
+        stages, 'build_tables', list,
+        integrity.iterate_checked_tables(
+            ((table, frame) for table, frame in loader.iterate_tables(
+                extracted_data, db_config.get('crew_jobs'))
+             if table in schema_info), schema_info))
+
+    if sink == SINK_POSTGRES:
+        con, cur = loader.create_connection(db_config)
+        loader.create_schema(schema_info, con, cur)
+        loader.disable_triggers(schema_info, con, cur)
+    else:
+        con, cur = NullConnection(), NullCursor()
+
+    run_stage(stages, 'load_tables', loader.load_tables, tables, schema_info,
+              [(con, cur)], batch_size, write, False)
+
+    if sink == SINK_POSTGRES:
+        loader.enable_triggers(schema_info, con, cur)
+        con.close()
+
+    return {
+        'scale': scale,
+        'sink': sink,
+        'engine': engine_name,
+        'csv_engine': csv_reader.ENGINE,
+        'movies': len(movie_data['extracted_movies']),
+        'persons': len(credits_data['extracted_persons']),
+        'keywords': len(keywords_data['extracted_keywords']),
+        'ratings': len(df_ratings),
+        'rows': {table: len(frame)
+                 for table, frame in tables},
+        'loader_stages': instrumentation.get_summary(),
+        'stages': stages
+    }
+
+
+def main(argc, argv):
+    arguments = loader.parse_arguments(argv[1:], OPTIONS)
+    if arguments == None or len(arguments[0]) != 0:
+        print(HELP_TEXT)
+        return
+    options = arguments[1]
+    sink = options.get('sink', SINK_NULL)
+    engine_name = options.get('engine', bulk_writer.DEFAULT_ENGINE)
+    data_dir = options.get('data-dir', DEFAULT_DATA_DIR)
+    try:
+        scales = [
+            int(scale) for scale in options.get('scales',
+                                                DEFAULT_SCALES).split(',')
+        ]
+    except ValueError:
+        print(HELP_TEXT)
+        return
+    if not sink in (SINK_NULL, SINK_POSTGRES):
+        print(HELP_TEXT)
+        return
+
+    results = {
+        'git_commit': get_git_commit(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'runs': []
+    }
+    for scale in scales:
+        path = os.path.join(data_dir, 'scale_' + str(scale))
+        if not os.path.exists(os.path.join(path, loader.LINKS)):
+            print('Generate dataset with scale', scale, '...')
+            generate_dataset(path, scale)
+        results['runs'].append(run_benchmark(path, scale, sink, engine_name))
+
+    output = json.dumps(results, indent=2)
+    if 'output' in options:
+        f_output = open(options['output'], 'w')
+        f_output.write(output)
+        f_output.close()
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main(len(sys.argv), sys.argv)
@@ -0,0 +1,125 @@
+#!/usr/bin/python3
+
+import io
+import struct
+
+# write engines which can be selected with the 'write_engine' option in
+# db_config.json
+ENGINE_EXECUTEMANY = 'executemany'
+ENGINE_COPY = 'copy'
+ENGINE_COPY_BINARY = 'copy_binary'
+DEFAULT_ENGINE = ENGINE_COPY
+
+# mapping of postgres type oids to the binary COPY types
+BINARY_TYPES = {
+    21: 'int2',
+    23: 'int4',
+    20: 'int8',
+    700: 'float4',
+    701: 'float8'
+}
+
+BINARY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+BINARY_TRAILER = struct.pack('>h', -1)
+
+# representation of NULL in the csv data sent with COPY
+CSV_NULL = '\\N'
+
+
+def get_insert_query(table, columns):
+    return ('INSERT INTO ' + table + ' (' + ', '.join(columns)
+            + ') VALUES (' + ', '.join(['%s'] * len(columns)) + ')')
+
+
+def get_copy_query(table, columns, binary=False):
+    query = 'COPY ' + table + ' (' + ', '.join(columns) + ') FROM STDIN'
+    if binary:
+        query += ' WITH (FORMAT binary)'
+    else:
+        query += " WITH (FORMAT csv, NULL '" + CSV_NULL + "')"
+    return query
+
+
+# Returns the rows of a DataFrame as tuples of python values, missing values
+# are returned as None.
+def get_frame_rows(frame):
+    values = frame.astype(object)
+    return list(
+        values.where(values.notna(), None).itertuples(index=False,
+                                                      name=None))
+
+
+def encode_binary_value(value, binary_type):
+    if value == None:
+        return struct.pack('>i', -1)
+    if binary_type == 'int2':
+        return struct.pack('>ih', 2, int(value))
+    if binary_type == 'int4':
+        return struct.pack('>ii', 4, int(value))
+    if binary_type == 'int8':
+        return struct.pack('>iq', 8, int(value))
+    if binary_type == 'float4':
+        return struct.pack('>if', 4, float(value))
+    if binary_type == 'float8':
+        return struct.pack('>id', 8, float(value))
+    data = str(value).encode('utf-8')
+    return struct.pack('>i', len(data)) + data
+
+
+def write_executemany(cur, table, frame):
+    cur.executemany(get_insert_query(table, list(frame.columns)),
+                    get_frame_rows(frame))
+
+
+# Writes the DataFrame with COPY in csv format; the csv file is created by
+# pandas without converting the values to python objects.
+def write_copy_csv(cur, table, frame):
+    stream = io.StringIO()
+    frame.to_csv(stream, header=False, index=False, na_rep=CSV_NULL)
+    stream.seek(0)
+    cur.copy_expert(get_copy_query(table, list(frame.columns)), stream)
+
+
+# Returns the binary COPY types of the columns of a table. All types which are
+# not numeric are sent as text.
+def get_binary_types(cur, table, columns):
+    cur.execute('SELECT ' + ', '.join(columns) + ' FROM ' + table + ' LIMIT 0')
+    return [
+        BINARY_TYPES.get(column.type_code, 'text')
+        for column in cur.description
+    ]
+
+
+def create_copy_binary_writer():
+    # column types per (table, columns), requested once from the database
+    binary_types_cache = dict()
+
+    def write_copy_binary(cur, table, frame):
+        columns = list(frame.columns)
+        key = (table, tuple(columns))
+        if not key in binary_types_cache:
+            binary_types_cache[key] = get_binary_types(cur, table, columns)
+        binary_types = binary_types_cache[key]
+        field_count = struct.pack('>h', len(columns))
+        stream = io.BytesIO()
+        stream.write(BINARY_HEADER)
+        for row in get_frame_rows(frame):
+            stream.write(field_count)
+            for value, binary_type in zip(row, binary_types):
+                stream.write(encode_binary_value(value, binary_type))
+        stream.write(BINARY_TRAILER)
+        stream.seek(0)
+        cur.copy_expert(get_copy_query(table, columns, binary=True), stream)
+    return write_copy_binary
+
+
+# Returns a function write(cur, table, frame) which sends the rows of a
+# DataFrame to the database with the selected engine.
+def create_write_engine(engine_name):
+    if engine_name == ENGINE_EXECUTEMANY:
+        return write_executemany
+    if engine_name == ENGINE_COPY:
+        return write_copy_csv
+    if engine_name == ENGINE_COPY_BINARY:
+        return create_copy_binary_writer()
+    raise ValueError('Unknown write engine: ' + str(engine_name))
@@ -0,0 +1,45 @@
+#!/usr/bin/python3
+
+import pandas as pd
+
+import instrumentation
+
+# Typed reading of the csv files. Every file is read with a schema, a
+# dictionary of the used columns and their types, so the parser skips the
+# other columns and does not have to infer types. Whole files are read with
+# the pyarrow engine if pyarrow is installed; files which are read in chunks
+# use the C engine, because the pyarrow engine can not read chunks.
+
+try:
+    import pyarrow
+    ENGINE = 'pyarrow'
+except ImportError:
+    ENGINE = 'c'
+
+CHUNK_ENGINE = 'c'
+
+
+def get_read_options(dtypes, engine):
+    return {'usecols': list(dtypes.keys()), 'dtype': dtypes, 'engine': engine}
+
+
+# Reads the columns of dtypes of a csv file, the reading is measured.
+def read_csv(name, path, dtypes, **kwargs):
+    with instrumentation.stage('read_csv ' + name) as record:
+        df = pd.read_csv(path, **get_read_options(dtypes, ENGINE), **kwargs)
+        record['rows_out'] = len(df)
+    return df
+
+
+# Reads the columns of dtypes of a csv file in chunks; the reading of every
+# chunk is measured.
+def read_csv_chunks(name, path, dtypes, **kwargs):
+    reader = pd.read_csv(path, **get_read_options(dtypes, CHUNK_ENGINE),
+                         **kwargs)
+    while True:
+        with instrumentation.stage('read_csv ' + name) as record:
+            chunk = next(reader, None)
+            record['rows_out'] = len(chunk) if chunk is not None else 0
+        if chunk is None:
+            return
+        yield chunk
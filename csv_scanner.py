@@ -0,0 +1,129 @@
+#!/usr/bin/python3
+
+import io
+import csv
+import mmap
+
+import numpy as np
+import pandas as pd
+
+import csv_reader
+import instrumentation
+
+# Splitting of a csv file into byte ranges of whole records, which can be
+# parsed independently of each other (e.g. by parallel workers). The file is
+# memory-mapped, so only the bytes of the range which is parsed are copied
+# into memory. A line break only ends a record if it is not inside a quoted
+# cell; this is given if the number of quote characters before it is even
+# (escaped quotes are doubled, so they do not change the parity).
+
+QUOTE = ord('"')
+NEWLINE = ord('\n')
+
+# bytes which are searched at once for the end of a record
+SCAN_WINDOW = 1 << 16
+
+
+def open_mapped(path):
+    f_csv = open(path, 'rb')
+    try:
+        return mmap.mmap(f_csv.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        # an empty file can not be mapped
+        return b''
+    finally:
+        f_csv.close()
+
+
+# Returns the number of line breaks between start and end which are not inside
+# a quoted cell and whether end is inside a quoted cell. quoted tells whether
+# start is inside a quoted cell.
+def count_record_breaks(data, start, end, quoted):
+    breaks = 0
+    while start < end:
+        stop = min(start + SCAN_WINDOW, end)
+        window = np.frombuffer(data, dtype=np.uint8, count=stop - start,
+                               offset=start)
+        in_quotes = (np.cumsum(window == QUOTE) + quoted) % 2 == 1
+        breaks += int(np.count_nonzero((window == NEWLINE) & ~in_quotes))
+        quoted = bool(in_quotes[-1])
+        start = stop
+    return breaks, quoted
+
+
+# Returns the position after the first line break at or after start which is
+# not inside a quoted cell (the end of the file if there is none). quoted
+# tells whether start is inside a quoted cell.
+def find_record_end(data, start, quoted):
+    while start < len(data):
+        end = min(start + SCAN_WINDOW, len(data))
+        window = np.frombuffer(data, dtype=np.uint8, count=end - start,
+                               offset=start)
+        # parity of the quotes up to every byte of the window
+        in_quotes = (np.cumsum(window == QUOTE) + quoted) % 2 == 1
+        breaks = np.flatnonzero((window == NEWLINE) & ~in_quotes)
+        if len(breaks) > 0:
+            return start + int(breaks[0]) + 1
+        quoted = bool(in_quotes[-1])
+        start = end
+    return len(data)
+
+
+# Returns the (start, end, first row) byte ranges of the records of the file,
+# every range starts at the first record after a multiple of range_bytes; the
+# header line is not part of any range. first row is the number of the first
+# record of the range, counted from 0 like the rows of a read of the whole
+# file. The file is scanned block by block, so the memory usage does not
+# depend on the size of the file.
+def get_record_ranges(data, range_bytes):
+    position = find_record_end(data, 0, False)
+    starts = [(position, 0)]
+    rows = 0
+    for offset in range(range_bytes, len(data), range_bytes):
+        if offset <= position:
+            # the offset is inside the record found before
+            continue
+        breaks, quoted = count_record_breaks(data, position, offset, False)
+        start = find_record_end(data, offset, quoted)
+        rows += breaks + count_record_breaks(data, offset, start, quoted)[0]
+        position = start
+        if start < len(data):
+            starts.append((start, rows))
+    ends = [start for start, _ in starts[1:]] + [len(data)]
+    return [(start, end, first_row)
+            for (start, first_row), end in zip(starts, ends) if start < end]
+
+
+def read_header(data):
+    line = bytes(data[:find_record_end(data, 0, False)]).decode('utf-8')
+    return next(csv.reader([line]), [])
+
+
+# Reads the columns of dtypes of the records in a byte range of the file. The
+# rows are numbered from first_row on, so they match the rows of the file.
+def read_range(name, data, header, start, end, first_row, dtypes):
+    with instrumentation.stage('read_csv ' + name) as record:
+        df = pd.read_csv(io.BytesIO(data[start:end]),
+                         header=None,
+                         names=header,
+                         **csv_reader.get_read_options(
+                             dtypes, csv_reader.CHUNK_ENGINE))
+        df.index += first_row
+        record['rows_out'] = len(df)
+    return df
+
+
+# Yields (range number, DataFrame) for every shard_count-th byte range of the
+# file starting with range shard. Every range holds the records which start in
+# range_bytes bytes of the file.
+def iterate_record_ranges(name, path, dtypes, range_bytes, shard=0,
+                          shard_count=1):
+    data = open_mapped(path)
+    header = read_header(data)
+    ranges = get_record_ranges(data, range_bytes)
+    for i in range(shard, len(ranges), shard_count):
+        start, end, first_row = ranges[i]
+        yield i, read_range(name, data, header, start, end, first_row,
+                            dtypes)
+    if isinstance(data, mmap.mmap):
+        data.close()
@@ -0,0 +1,133 @@
+#!/usr/bin/python3
+
+import re
+
+# Splits the table definitions of db_schema.json into bare tables and the
+# primary keys, foreign keys and indexes which are created after the load.
+
+PRIMARY_KEY_PATTERN = re.compile(r'\s+primary\s+key', re.IGNORECASE)
+TABLE_PRIMARY_KEY_PATTERN = re.compile(r'primary\s+key\s*\(([^)]*)\)',
+                                       re.IGNORECASE)
+FOREIGN_KEY_PATTERN = re.compile(
+    r'foreign\s+key\s*\(([^)]*)\)\s*references\s+(\w+)\s*\(([^)]*)\)',
+    re.IGNORECASE)
+
+
+# Splits a table definition into the part in the brackets and the options
+# after it (e.g. 'partition by range (id)'). Partitions of another table
+# ('partition of t for values ...') have no bracket part.
+def split_table_options(table_schema):
+    table_schema = table_schema.strip()
+    if not table_schema.startswith('('):
+        return '', table_schema
+    depth = 0
+    for i, char in enumerate(table_schema):
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if depth == 0:
+                return table_schema[1:i], table_schema[i + 1:].strip()
+    return table_schema[1:], ''
+
+
+def split_column_definitions(table_schema):
+    # splits '(a integer, b varchar, foreign key (a) references t (id))'
+    # at the commas on the top level of the brackets
+    definitions = []
+    depth = 0
+    current = ''
+    for char in split_table_options(table_schema)[0]:
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        if char == ',' and depth == 0:
+            definitions.append(current.strip())
+            current = ''
+        else:
+            current += char
+    if len(current.strip()) > 0:
+        definitions.append(current.strip())
+    return definitions
+
+
+def get_column_names(columns):
+    return [column.strip() for column in columns.split(',')]
+
+
+# Returns the column definitions without constraints, the primary key columns
+# and the foreign keys as (columns, referenced table, referenced columns).
+def parse_table_schema(table_schema):
+    columns = []
+    primary_key = []
+    foreign_keys = []
+    for definition in split_column_definitions(table_schema):
+        foreign_key = FOREIGN_KEY_PATTERN.match(definition)
+        table_primary_key = TABLE_PRIMARY_KEY_PATTERN.match(definition)
+        if foreign_key != None:
+            foreign_keys.append(
+                (get_column_names(foreign_key.group(1)), foreign_key.group(2),
+                 get_column_names(foreign_key.group(3))))
+        elif table_primary_key != None:
+            primary_key.extend(get_column_names(table_primary_key.group(1)))
+        elif PRIMARY_KEY_PATTERN.search(definition):
+            columns.append(PRIMARY_KEY_PATTERN.sub('', definition))
+            primary_key.append(definition.split()[0])
+        else:
+            columns.append(definition)
+    return columns, primary_key, foreign_keys
+
+
+def get_bare_schema_info(schema_info):
+    bare_schema_info = dict()
+    for table_name, table_schema in schema_info.items():
+        definitions, options = split_table_options(table_schema)
+        if len(definitions) == 0:
+            bare_schema_info[table_name] = options
+            continue
+        columns, primary_key, foreign_keys = parse_table_schema(table_schema)
+        bare_schema_info[table_name] = ' '.join(
+            ['(' + ', '.join(columns) + ')', options]).strip()
+    return bare_schema_info
+
+
+# Returns the statements which create the primary keys and an index for every
+# foreign key column, mapped to a name for the statement. They can run in
+# parallel as they only lock one table each.
+def get_index_statements(schema_info):
+    statements = dict()
+    for table_name, table_schema in schema_info.items():
+        columns, primary_key, foreign_keys = parse_table_schema(table_schema)
+        if len(primary_key) > 0:
+            statements[table_name + '_pkey'] = (
+                'ALTER TABLE ' + table_name + ' ADD PRIMARY KEY ('
+                + ', '.join(primary_key) + ');')
+        for fk_columns, referenced_table, referenced_columns in foreign_keys:
+            index_name = table_name + '_' + '_'.join(fk_columns) + '_idx'
+            statements[index_name] = (
+                'CREATE INDEX ' + index_name + ' ON ' + table_name + ' ('
+                + ', '.join(fk_columns) + ');')
+    return statements
+
+
+# Returns a list of (table, constraint name, statement) for the foreign keys.
+# The constraints are added as NOT VALID and have to be validated afterwards.
+def get_foreign_key_statements(schema_info):
+    statements = []
+    for table_name, table_schema in schema_info.items():
+        columns, primary_key, foreign_keys = parse_table_schema(table_schema)
+        for fk_columns, referenced_table, referenced_columns in foreign_keys:
+            constraint_name = table_name + '_' + '_'.join(fk_columns) + '_fkey'
+            statements.append(
+                (table_name, constraint_name,
+                 'ALTER TABLE ' + table_name + ' ADD CONSTRAINT '
+                 + constraint_name + ' FOREIGN KEY (' + ', '.join(fk_columns)
+                 + ') REFERENCES ' + referenced_table + ' ('
+                 + ', '.join(referenced_columns) + ') NOT VALID;'))
+    return statements
+
+
+def get_validate_statement(table_name, constraint_name):
+    return ('ALTER TABLE ' + table_name + ' VALIDATE CONSTRAINT '
+            + constraint_name + ';')
@@ -0,0 +1,68 @@
+#!/usr/bin/python3
+
+# Set based merge of a staging table into a table of the database. Tables
+# with an 'id' column are matched by their id, other tables by their primary
+# key if they have one and relation tables without an id column by all of
+# their columns.
+
+
+def get_staging_table_name(table):
+    return 'staging_' + table
+
+
+def get_key_columns(columns, primary_key=[]):
+    if 'id' in columns:
+        return ['id']
+    if len(primary_key) > 0 and set(primary_key) <= set(columns):
+        return list(primary_key)
+    return list(columns)
+
+
+# Creates an empty temporary table with the given columns of the table. As
+# temporary tables are only visible to one session, the staging table has to
+# be filled and merged over the same connection.
+def create_staging_table(cur, table, columns):
+    staging = get_staging_table_name(table)
+    cur.execute('DROP TABLE IF EXISTS ' + staging + ';')
+    cur.execute('CREATE TEMP TABLE ' + staging + ' AS SELECT '
+                + ', '.join(columns) + ' FROM ' + table + ' WITH NO DATA;')
+    return staging
+
+
+# Deletes the rows which are missing in the staging table, updates changed
+# rows and inserts new rows. Returns the number of affected rows.
+def merge_staging_table(cur, table, staging, columns, primary_key=[]):
+    key_columns = get_key_columns(columns, primary_key)
+    value_columns = [
+        column for column in columns if not column in key_columns
+    ]
+    match = ' AND '.join(
+        ['t.' + column + ' = s.' + column for column in key_columns])
+    counts = dict()
+
+    cur.execute('ANALYZE ' + staging + ';')
+
+    cur.execute('DELETE FROM ' + table + ' t WHERE NOT EXISTS (SELECT 1 FROM '
+                + staging + ' s WHERE ' + match + ');')
+    counts['deleted'] = cur.rowcount
+
+    counts['updated'] = 0
+    if len(value_columns) > 0:
+        cur.execute(
+            'UPDATE ' + table + ' t SET '
+            + ', '.join([column + ' = s.' + column
+                         for column in value_columns])
+            + ' FROM ' + staging + ' s WHERE ' + match + ' AND ('
+            + ', '.join(['t.' + column for column in value_columns])
+            + ') IS DISTINCT FROM ('
+            + ', '.join(['s.' + column for column in value_columns]) + ');')
+        counts['updated'] = cur.rowcount
+
+    cur.execute('INSERT INTO ' + table + ' (' + ', '.join(columns)
+                + ') SELECT ' + ', '.join(['s.' + column for column in columns])
+                + ' FROM ' + staging + ' s WHERE NOT EXISTS (SELECT 1 FROM '
+                + table + ' t WHERE ' + match + ');')
+    counts['inserted'] = cur.rowcount
+
+    cur.execute('DROP TABLE ' + staging + ';')
+    return counts
@@ -0,0 +1,55 @@
+#!/usr/bin/python3
+
+import os
+import json
+import numpy as np
+import pandas as pd
+
+# Dictionary encoding of the entities which have no id in the dataset but
+# are identified by a key (the ISO codes of the languages and countries, the
+# names of the departments and jobs). Every entity has a code table which
+# maps the keys to ids; new keys get the next free id. The code tables are
+# kept in a JSON file between runs, so an entity keeps its id in later (e.g.
+# incremental) loads even if it appears in another order or is missing in
+# between.
+
+DEFAULT_CODES_FILE = 'entity_codes.json'
+
+
+def read_codes(path):
+    if path == None or not os.path.exists(path):
+        return dict()
+    f_codes = open(path, 'r')
+    codes = json.loads(f_codes.read())
+    f_codes.close()
+    return codes
+
+
+def write_codes(path, codes):
+    if path == None:
+        return
+    f_codes = open(path + '.tmp', 'w')
+    f_codes.write(json.dumps(codes, indent=2, ensure_ascii=False))
+    f_codes.close()
+    os.replace(path + '.tmp', path)
+
+
+# Returns the ids of the keys as Int64 array, missing keys get NA. The keys
+# are factorized first, so the code table is only accessed once per distinct
+# key; new keys are numbered from first_id (or the highest id + 1) in the
+# order of their first occurrence.
+def encode_keys(codes, entity, keys, first_id=0):
+    code_table = codes.setdefault(entity, dict())
+    key_positions, unique_keys = pd.factorize(pd.Series(keys, dtype=object))
+    if len(unique_keys) == 0:
+        return pd.array([pd.NA] * len(key_positions), dtype='Int64')
+    next_id = max(code_table.values()) + 1 if len(code_table) > 0 else first_id
+    unique_ids = np.empty(len(unique_keys), dtype='int64')
+    for i, key in enumerate(unique_keys):
+        if not key in code_table:
+            code_table[key] = next_id
+            next_id += 1
+        unique_ids[i] = code_table[key]
+    ids = pd.array(unique_ids[key_positions.clip(min=0)], dtype='Int64')
+    ids[key_positions < 0] = pd.NA
+    return ids
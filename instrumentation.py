@@ -0,0 +1,147 @@
+#!/usr/bin/python3
+
+import json
+import time
+import resource
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+
+# Records wall time, CPU time and row counts of the stages of a run. The CPU
+# time of a stage is the time of the thread it runs in, as stages run in
+# parallel threads. The peak RSS is only known for the whole process, so
+# every stage records the high-water mark of the process at its end
+# (process_peak_rss_mb). The records are kept per process; records of worker
+# processes have to be returned to the main process and added with
+# add_records.
+
+records = []
+counts = dict()
+settings = {'profile_stages': set(), 'trace_memory_stages': set()}
+
+
+# Resets the records. Stages whose names are in profile_stages are run with
+# cProfile (written to profile_<stage>.prof), stages in trace_memory_stages
+# with tracemalloc.
+def start_run(profile_stages=(), trace_memory_stages=()):
+    records.clear()
+    counts.clear()
+    settings['profile_stages'] = set(profile_stages)
+    settings['trace_memory_stages'] = set(trace_memory_stages)
+
+
+def get_peak_rss_mb():
+    # ru_maxrss is given in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def get_profile_path(name):
+    return 'profile_' + name.replace(' ', '_') + '.prof'
+
+
+# Measures the enclosed block. The yielded record can be used to set the
+# number of rows which were produced ('rows_out').
+@contextmanager
+def stage(name, rows_in=None):
+    record = {'stage': name, 'rows_in': rows_in, 'rows_out': None}
+    profiler = None
+    if name in settings['profile_stages']:
+        profiler = cProfile.Profile()
+    trace_memory = (name in settings['trace_memory_stages']
+                    and not tracemalloc.is_tracing())
+    if trace_memory:
+        tracemalloc.start()
+    start_wall = time.perf_counter()
+    start_cpu = time.thread_time()
+    if profiler != None:
+        profiler.enable()
+    try:
+        yield record
+    finally:
+        if profiler != None:
+            profiler.disable()
+            profiler.dump_stats(get_profile_path(name))
+        record['wall_time'] = time.perf_counter() - start_wall
+        record['cpu_time'] = time.thread_time() - start_cpu
+        record['process_peak_rss_mb'] = get_peak_rss_mb()
+        if trace_memory:
+            record['traced_peak_mb'] = (tracemalloc.get_traced_memory()[1]
+                                        / (1024 * 1024))
+            tracemalloc.stop()
+        rows = record['rows_out'] if record[
+            'rows_out'] != None else record['rows_in']
+        record['rows_per_second'] = (rows / record['wall_time']
+                                     if rows != None
+                                     and record['wall_time'] > 0 else None)
+        records.append(record)
+
+
+def get_records():
+    return list(records)
+
+
+def add_records(new_records):
+    records.extend(new_records)
+
+
+# Stores counts (a dictionary of names and numbers) which are written to the
+# report under the given name.
+def set_counts(name, new_counts):
+    counts[name] = dict(new_counts)
+
+
+# Returns the settings of the run, which are passed to worker processes.
+def get_settings():
+    return dict(settings)
+
+
+# Runs function(*args) in a worker process with fresh records and the settings
+# of the main process (see get_settings) and returns the result together with
+# the records of the worker.
+def run_with_records(run_settings, function, *args):
+    records.clear()
+    settings.update(run_settings)
+    result = function(*args)
+    return result, get_records()
+
+
+# Sums up the records of every stage name.
+def get_summary():
+    summary = dict()
+    for record in records:
+        entry = summary.setdefault(
+            record['stage'], {
+                'count': 0,
+                'wall_time': 0.0,
+                'cpu_time': 0.0,
+                'rows_in': 0,
+                'rows_out': 0,
+                'process_peak_rss_mb': 0.0
+            })
+        entry['count'] += 1
+        entry['wall_time'] += record['wall_time']
+        entry['cpu_time'] += record['cpu_time']
+        entry['rows_in'] += record['rows_in'] or 0
+        entry['rows_out'] += record['rows_out'] or 0
+        entry['process_peak_rss_mb'] = max(entry['process_peak_rss_mb'],
+                                           record['process_peak_rss_mb'])
+    for entry in summary.values():
+        rows = entry['rows_out'] or entry['rows_in']
+        entry['rows_per_second'] = (rows / entry['wall_time']
+                                    if entry['wall_time'] > 0 else None)
+    return summary
+
+
+def write_report(path, extra=None):
+    report = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'peak_rss_mb': get_peak_rss_mb(),
+        'summary': get_summary(),
+        'counts': counts,
+        'stages': records
+    }
+    if extra != None:
+        report.update(extra)
+    f_report = open(path, 'w')
+    f_report.write(json.dumps(report, indent=2))
+    f_report.close()
@@ -0,0 +1,151 @@
+#!/usr/bin/python3
+
+import json
+import numpy as np
+import pandas as pd
+from collections import namedtuple
+
+import deferred_constraints
+import instrumentation
+
+# Checks the tables against the keys of db_schema.json before they are
+# loaded. Rows with an id which occurs more than once (the last one is kept),
+# duplicate rows of tables without an id and rows whose foreign keys
+# reference ids which are missing in the referenced table are rejected. The
+# ids of every checked table are kept as sorted array, so the foreign keys of
+# the tables referencing it can be checked with a binary search.
+
+REJECT_COLUMNS = ['table', 'reason', 'row']
+
+# Ids of a table which is built later, e.g. the ids of the movies, which are
+# known as soon as the movies file is extracted while the movies table waits
+# for the ratings. The tables referencing the table are checked against these
+# ids instead of waiting for it; when the table arrives, its checked ids
+# replace them.
+AnnouncedIds = namedtuple('AnnouncedIds', ['ids'])
+
+
+# Returns a dictionary which maps every table to a list of (column,
+# referenced table) for its foreign keys on single columns.
+def get_foreign_keys(schema_info):
+    foreign_keys = dict()
+    for table_name, table_schema in schema_info.items():
+        columns, primary_key, table_foreign_keys = (
+            deferred_constraints.parse_table_schema(table_schema))
+        foreign_keys[table_name] = [
+            (fk_columns[0], referenced_table) for fk_columns,
+            referenced_table, referenced_columns in table_foreign_keys
+            if len(fk_columns) == 1 and referenced_table != table_name
+        ]
+    return foreign_keys
+
+
+def create_id_index(frame):
+    return np.unique(frame['id'].dropna().to_numpy(dtype='int64'))
+
+
+# Returns a boolean array which is true for the values missing in the index.
+# Missing values (NULL) are not checked.
+def get_orphan_mask(values, index):
+    present = values.notna().to_numpy()
+    keys = values[present].to_numpy(dtype='int64')
+    positions = np.searchsorted(index, keys).clip(max=max(len(index) - 1, 0))
+    missing = np.ones(len(keys), dtype=bool)
+    if len(index) > 0:
+        missing = index[positions] != keys
+    mask = np.zeros(len(values), dtype=bool)
+    mask[present] = missing
+    return mask
+
+
+# Returns the rows of the frame which pass the checks and the rejected rows
+# with the reason of the rejection.
+def check_table(frame, foreign_keys, id_indexes):
+    if 'id' in frame.columns:
+        duplicate_mask = frame.duplicated('id', keep='last').to_numpy()
+    else:
+        duplicate_mask = frame.duplicated().to_numpy()
+    rejected = [(frame[duplicate_mask], 'duplicate')]
+    frame = frame[~duplicate_mask]
+    for column, referenced_table in foreign_keys:
+        if not column in frame.columns or not referenced_table in id_indexes:
+            continue
+        orphan_mask = get_orphan_mask(frame[column],
+                                      id_indexes[referenced_table])
+        rejected.append((frame[orphan_mask],
+                         'missing ' + referenced_table + ' ' + column))
+        frame = frame[~orphan_mask]
+    return frame.reset_index(drop=True), [(rows, reason)
+                                          for rows, reason in rejected
+                                          if len(rows) > 0]
+
+
+def create_reject_file(path):
+    pd.DataFrame(columns=REJECT_COLUMNS).to_csv(path, index=False)
+
+
+# Appends the rejected rows to the reject file, every row is stored as JSON.
+def write_rejected_rows(path, table, rows, reason):
+    values = rows.astype(object)
+    values = values.where(values.notna(), None)
+    pd.DataFrame({
+        'table': table,
+        'reason': reason,
+        'row': [json.dumps(row) for row in values.to_dict('records')]
+    }, columns=REJECT_COLUMNS).to_csv(path, mode='a', header=False,
+                                      index=False)
+
+
+# Yields the checked tables of tables (pairs of table name and DataFrame). A
+# table is held back until the tables it references are checked or their ids
+# are announced (a pair of table name and AnnouncedIds); tables whose
+# referenced tables never arrive are checked against the available ones at
+# the end. Tables which are streamed in chunks are passed on unchecked. The
+# number of rejected rows is added to the run report, the rows themselves are
+# appended to reject_path unless it is None.
+def iterate_checked_tables(tables, schema_info, reject_path=None):
+    foreign_keys = get_foreign_keys(schema_info)
+    id_indexes = dict()
+    waiting = dict()
+    rejected_counts = dict()
+    if reject_path != None:
+        create_reject_file(reject_path)
+
+    def check(table):
+        frame = waiting.pop(table)
+        # streamed tables are not checked and have no id index
+        if not isinstance(frame, pd.DataFrame):
+            return frame
+        with instrumentation.stage('check ' + table,
+                                   rows_in=len(frame)) as record:
+            frame, rejected = check_table(frame, foreign_keys.get(table, []),
+                                          id_indexes)
+            record['rows_out'] = len(frame)
+            if 'id' in frame.columns:
+                id_indexes[table] = create_id_index(frame)
+        for rows, reason in rejected:
+            print('Reject %d rows of %s (%s)' % (len(rows), table, reason))
+            rejected_counts[table + ' ' + reason] = len(rows)
+            if reject_path != None:
+                write_rejected_rows(reject_path, table, rows, reason)
+        instrumentation.set_counts('rejected_rows', rejected_counts)
+        return frame
+
+    def is_ready(table):
+        return all([
+            referenced_table in id_indexes
+            for column, referenced_table in foreign_keys.get(table, [])
+        ])
+
+    for table, frame in tables:
+        if isinstance(frame, AnnouncedIds):
+            id_indexes[table] = np.unique(frame.ids)
+        else:
+            waiting[table] = frame
+        ready = [table for table in waiting if is_ready(table)]
+        while len(ready) > 0:
+            for ready_table in ready:
+                yield ready_table, check(ready_table)
+            ready = [table for table in waiting if is_ready(table)]
+    for table in list(waiting.keys()):
+        yield table, check(table)
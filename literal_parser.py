@@ -0,0 +1,100 @@
+#!/usr/bin/python3
+
+import ast
+import re
+
+# Parser for the cells of the dataset which contain python representations of
+# dictionaries or lists of flat dictionaries, e.g.
+#   "[{'id': 16, 'name': 'Animation'}, {'id': 35, 'name': 'Comedy'}]"
+# Only literals are accepted, so it is safe to use on untrusted files, and
+# values of keys which are not requested are never decoded.
+
+TOKEN_PATTERN = re.compile(
+    r"""\s*(?:
+        '([^'\\]*)'\s*:\s*                  # 1: key followed by
+        ('[^'\\]*(?:\\.[^'\\]*)*'           # 2: a single quoted string,
+        |"[^"\\]*(?:\\.[^"\\]*)*"           #    a double quoted string,
+        |[-+.\w]+)                          #    a number or a constant
+      | ([{}\[\],])                        # 3: brackets and separators
+      | (\S)                                # 4: anything else
+    )""", re.VERBOSE)
+
+CONSTANTS = {'None': None, 'True': True, 'False': False}
+
+# states of the parser: the tokens which are expected next
+START = 'opening bracket'
+FIRST_DICT = 'first dictionary'
+NEXT_DICT = 'dictionary'
+FIRST_PAIR = 'first key'
+NEXT_PAIR = 'key'
+AFTER_PAIR = 'separator in dictionary'
+AFTER_DICT = 'separator in list'
+END = 'end of cell'
+
+
+def decode_value(value):
+    first = value[0]
+    if first == "'" or first == '"':
+        if '\\' in value:
+            return ast.literal_eval(value)
+        return value[1:-1]
+    if value in CONSTANTS:
+        return CONSTANTS[value]
+    if '.' in value or 'e' in value or 'E' in value:
+        return float(value)
+    return int(value)
+
+
+# Parses a list of flat dictionaries (or a single dictionary if in_list is
+# False). Elements and key/value pairs have to be separated by exactly one
+# comma and nothing may follow the closing bracket. If keys is given, only
+# those keys are added to the dictionaries; every dictionary has to contain
+# the keys of required.
+def parse_tokens(text, keys, required, in_list):
+    result = []
+    current = None
+    state = START
+    for match in TOKEN_PATTERN.finditer(text):
+        key, value, token, unexpected = match.groups()
+        if key:
+            token = 'key ' + key
+        if state == START and token == ('[' if in_list else '{'):
+            state = FIRST_DICT if in_list else FIRST_PAIR
+        elif state in (FIRST_DICT, NEXT_DICT) and token == '{':
+            state = FIRST_PAIR
+        elif state in (FIRST_PAIR, NEXT_PAIR) and key:
+            if keys == None or key in keys:
+                current[key] = decode_value(value)
+            state = AFTER_PAIR
+        elif state in (FIRST_PAIR, AFTER_PAIR) and token == '}':
+            missing = [name for name in required if not name in current]
+            if len(missing) > 0:
+                raise ValueError('Missing key ' + ', '.join(sorted(missing)))
+            result.append(current)
+            state = AFTER_DICT if in_list else END
+        elif state == AFTER_PAIR and token == ',':
+            state = NEXT_PAIR
+        elif state in (FIRST_DICT, AFTER_DICT) and token == ']':
+            state = END
+        elif state == AFTER_DICT and token == ',':
+            state = NEXT_DICT
+        else:
+            raise ValueError('Expected %s at position %d, found %s' %
+                             (state, match.start(), token or unexpected))
+        if state == FIRST_PAIR:
+            current = dict()
+    if state != END:
+        raise ValueError('Unexpected end of cell, expected ' + state)
+    return result
+
+
+# Parses a cell and returns a list of dictionaries. If keys is given, only
+# those keys are added to the dictionaries. Raises a ValueError if the cell is
+# not a list of flat dictionaries or a dictionary misses a key of required.
+def parse_dict_list(text, keys=None, required=()):
+    return parse_tokens(text, keys, required, True)
+
+
+# Parses a cell containing a single dictionary.
+def parse_dict(text, keys=None, required=()):
+    return parse_tokens(text, keys, required, False)[0]
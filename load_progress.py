@@ -0,0 +1,56 @@
+#!/usr/bin/python3
+
+# Progress of a full or shadow load, kept in a table of the target schema. The
+# number of loaded rows of a table is updated in the same transaction as the
+# batch which was written, so an interrupted load can be resumed from the last
+# committed batch. The table is dropped when the load is complete.
+
+PROGRESS_TABLE = 'import_progress'
+
+
+def get_progress_table_name(schema):
+    return schema + '.' + PROGRESS_TABLE
+
+
+def create_progress_table(progress_table, con, cur):
+    cur.execute('DROP TABLE IF EXISTS ' + progress_table + ';')
+    cur.execute('CREATE TABLE ' + progress_table
+                + ' (step varchar(255) primary key, mode varchar(32) not null,'
+                + ' rows_loaded bigint not null, rows_total bigint not null,'
+                + ' completed boolean not null);')
+    con.commit()
+
+
+def has_progress_table(progress_table, cur):
+    cur.execute('SELECT to_regclass(%s);', (progress_table, ))
+    return cur.fetchone()[0] != None
+
+
+# Returns the mode of the interrupted load and a dictionary which maps every
+# recorded step to (rows_loaded, rows_total, completed).
+def read_progress(progress_table, cur):
+    cur.execute('SELECT step, mode, rows_loaded, rows_total, completed FROM '
+                + progress_table + ';')
+    mode = None
+    progress = dict()
+    for step, step_mode, rows_loaded, rows_total, completed in cur.fetchall():
+        mode = step_mode
+        progress[step] = (rows_loaded, rows_total, completed)
+    return mode, progress
+
+
+# Records the progress of a step without committing, so it becomes visible
+# together with the work of the step.
+def set_progress(progress_table, cur, step, mode, rows_loaded, rows_total,
+                 completed=False):
+    cur.execute('INSERT INTO ' + progress_table
+                + ' (step, mode, rows_loaded, rows_total, completed) VALUES'
+                + ' (%s, %s, %s, %s, %s) ON CONFLICT (step) DO UPDATE SET'
+                + ' rows_loaded = excluded.rows_loaded,'
+                + ' rows_total = excluded.rows_total,'
+                + ' completed = excluded.completed;',
+                (step, mode, rows_loaded, rows_total, completed))
+
+
+def drop_progress_table(progress_table, cur):
+    cur.execute('DROP TABLE IF EXISTS ' + progress_table + ';')
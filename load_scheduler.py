@@ -0,0 +1,140 @@
+#!/usr/bin/python3
+
+import re
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from concurrent.futures import FIRST_COMPLETED
+from queue import Queue
+from queue import Full
+
+REFERENCES_PATTERN = re.compile(r'references\s+(\w+)', re.IGNORECASE)
+
+
+# Returns a dictionary which maps every table of the schema to the set of
+# tables it references with foreign keys.
+def get_table_dependencies(schema_info):
+    dependencies = dict()
+    for table_name, table_schema in schema_info.items():
+        dependencies[table_name] = set(
+            REFERENCES_PATTERN.findall(table_schema)) - {table_name}
+    return dependencies
+
+
+# Returns the tables in an order in which every table comes after the tables
+# it depends on.
+def get_load_order(tables, dependencies):
+    order = []
+    done = set()
+    pending = list(tables)
+    while len(pending) > 0:
+        ready = [
+            table for table in pending
+            if dependencies.get(table, set()) & set(tables) <= done
+        ]
+        if len(ready) == 0:
+            raise ValueError('Cyclic dependencies between the tables: '
+                             + ', '.join(pending))
+        for table in ready:
+            order.append(table)
+            done.add(table)
+            pending.remove(table)
+    return order
+
+
+# Loads the tables with one thread per connection. A table is only started
+# once all tables it depends on are loaded completely. load_table is called
+# as load_table(table, task, con, cur) where task is the value of tables.
+def run_load(tables, dependencies, connections, load_table):
+    table_queue = Queue()
+    for table, task in tables.items():
+        table_queue.put((table, task))
+    table_queue.put(None)
+    run_pipelined_load(table_queue, tables.keys(), dependencies, connections,
+                       load_table)
+    return
+
+
+# Like run_load, but the tables arrive as (table, task) pairs over a queue
+# while the first tables are already loaded; None marks the end of the
+# tables. table_names are the tables which are expected to arrive, a table
+# waits for the expected tables it depends on. The task of a table is
+# released as soon as the table is loaded. With max_pending, no further table
+# is taken from the queue while max_pending tables wait for a connection or
+# their dependencies (unless no table is loaded), so a bounded queue blocks
+# its producer.
+def run_pipelined_load(table_queue, table_names, dependencies, connections,
+                       load_table, max_pending=None):
+    table_names = set(table_names)
+    # check for cycles before anything is written
+    get_load_order(table_names, dependencies)
+
+    free_connections = Queue()
+    for connection in connections:
+        free_connections.put(connection)
+
+    tasks = dict()
+
+    def run_task(table):
+        con, cur = free_connections.get()
+        try:
+            load_table(table, tasks[table], con, cur)
+        finally:
+            free_connections.put((con, cur))
+        return table
+
+    pending = set()
+    done = set()
+    running = dict()
+    arrival = None
+    received = False
+    with ThreadPoolExecutor(max_workers=len(connections)) as executor, \
+            ThreadPoolExecutor(max_workers=1) as receiver:
+        try:
+            while True:
+                ready = [
+                    table for table in pending
+                    if dependencies.get(table, set()) & table_names <= done
+                ]
+                # the tables are only started when a connection is free, the
+                # others stay pending
+                for table in ready[:len(connections) - len(running)]:
+                    running[executor.submit(run_task, table)] = table
+                    pending.remove(table)
+                if arrival == None and not received and (
+                        max_pending == None or len(pending) < max_pending
+                        or len(running) == 0):
+                    arrival = receiver.submit(table_queue.get)
+                waiting = list(running.keys())
+                if arrival != None:
+                    waiting.append(arrival)
+                if len(waiting) == 0:
+                    if len(pending) > 0:
+                        raise ValueError('Tables wait for missing tables: '
+                                         + ', '.join(sorted(pending)))
+                    break
+                finished, _ = wait(waiting, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    if future is arrival:
+                        item = arrival.result()
+                        arrival = None
+                        if item == None:
+                            # tables which did not arrive are not waited for
+                            received = True
+                            table_names = set(tasks.keys()) | done
+                        else:
+                            tasks[item[0]] = item[1]
+                            pending.add(item[0])
+                    else:
+                        future.result()
+                        table = running.pop(future)
+                        done.add(table)
+                        del tasks[table]
+        except BaseException:
+            # a failed load ends the receiver, which waits for the next table
+            while arrival != None and not arrival.done():
+                try:
+                    table_queue.put(None, timeout=0.1)
+                except Full:
+                    pass
+            raise
+    return
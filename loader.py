@@ -1,15 +1,74 @@
 #!/usr/bin/python3
 
 import sys
+import time
 import json
+import numpy as np
 import pandas as pd
 import psycopg2
 import json
-from collections import Counter
-from collections import defaultdict
-
-HELP_TEXT = ('USAGE: \033[1mloader.py\033[0m dataset_base_path\n'
-             + '\tdataset_base_path: path to the extracted movie dataset folder')
+import itertools
+import threading
+import multiprocessing
+from array import array
+from queue import Queue
+from queue import Full
+from queue import Empty
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import as_completed
+
+import analytics
+import bulk_writer
+import csv_reader
+import csv_scanner
+import deferred_constraints
+import delta_merge
+import entity_codes
+import literal_parser
+import instrumentation
+import integrity
+import load_progress
+import load_scheduler
+import parse_cache
+import table_sinks
+
+HELP_TEXT = ('USAGE: \033[1mloader.py\033[0m [--workers n] [--mode m] '
+             + '[--sink s --output path] dataset_base_path\n'
+             + '\tdataset_base_path: path to the extracted movie dataset folder\n'
+             + '\t--workers: number of processes used to extract the data '
+             + '(default: 1)\n'
+             + '\t--mode: full (drop and recreate all tables, default), '
+             + 'incremental (only apply the changes to the existing tables) '
+             + 'shadow (load into a shadow schema and swap the tables '
+             + 'afterwards) or resume (continue an interrupted full or shadow '
+             + 'load)\n'
+             + '\t--sink: postgres (database from db_config.json, default), '
+             + 'parquet, csv (folder with a file per table) or sqlite '
+             + '(database file); only full loads can be written to files\n'
+             + '\t--output: folder or database file of the parquet, csv and '
+             + 'sqlite sinks\n'
+             + '\t--report: path of the JSON run report '
+             + '(default: run_report.json)\n'
+             + '\t--profile: comma separated stages which are run with '
+             + 'cProfile\n'
+             + '\t--trace-memory: comma separated stages which are run with '
+             + 'tracemalloc')
+
+# options which can be passed as --name value
+OPTIONS = [
+    'workers', 'mode', 'sink', 'output', 'report', 'profile', 'trace-memory'
+]
+
+# import modes
+MODE_FULL = 'full'
+MODE_INCREMENTAL = 'incremental'
+MODE_SHADOW = 'shadow'
+MODE_RESUME = 'resume'
+MODES = [MODE_FULL, MODE_INCREMENTAL, MODE_SHADOW, MODE_RESUME]
+
+# schemas used by the shadow mode
+DEFAULT_TARGET_SCHEMA = 'public'
+DEFAULT_SHADOW_SCHEMA = 'import_shadow'
 
 # dataset url:
 # https://www.kaggle.com/rounakbanik/the-movies-dataset#movies_metadata.csv
@@ -19,11 +78,130 @@ CREDITS = 'credits.csv'
 MOVIES = 'movies_metadata.csv'
 KEYWORDS = 'keywords.csv'
 RATINGS = 'ratings.csv'  # use 'ratings_small.csv' if ratings are unimportant for you
+LINKS = 'links.csv'
 DB_CONFIG_PATH = 'db_config.json'
+DEFAULT_REPORT_PATH = 'run_report.json'
 
 # schemes of the database tables
 TABLE_SCHEMA_FILE = 'db_schema.json'
 
+# columns and types which are read from the csv files (see csv_reader). The
+# ids and numbers of the movies are read as strings and converted afterwards,
+# since the movies file contains a few malformed rows.
+MOVIE_NUMBER_COLUMNS = ['budget', 'popularity', 'revenue', 'runtime']
+MOVIE_CSV_DTYPES = {
+    'id': 'str',
+    'original_title': 'str',
+    'belongs_to_collection': 'str',
+    'original_language': 'category',
+    'spoken_languages': 'str',
+    'production_companies': 'str',
+    'production_countries': 'str',
+    'release_date': 'str',
+    'genres': 'str',
+    'overview': 'str',
+    'budget': 'str',
+    'popularity': 'str',
+    'revenue': 'str',
+    'runtime': 'str'
+}
+# the ids are read as strings and converted by drop_invalid_ids
+CREDIT_CSV_DTYPES = {'cast': 'str', 'crew': 'str', 'id': 'str'}
+KEYWORD_CSV_DTYPES = {'id': 'str', 'keywords': 'str'}
+LINK_CSV_DTYPES = {'movieId': 'Int64', 'imdbId': 'Int64', 'tmdbId': 'Int64'}
+
+# columns and types which are loaded from the ratings file
+RATING_DTYPES = {'movieId': 'int32', 'rating': 'float32'}
+DEFAULT_RATINGS_CHUNK_SIZE = 1000000
+
+# columns of the ratings and links files and the columns of the tables they
+# are written to with the raw_ratings option
+RAW_RATING_DTYPES = {
+    'userId': 'int32',
+    'movieId': 'int32',
+    'rating': 'float32',
+    'timestamp': 'int64'
+}
+RAW_RATING_COLUMNS = {
+    'userId': 'user_id',
+    'movieId': 'movielens_id',
+    'rating': 'rating',
+    'timestamp': 'rated_at'
+}
+LINK_COLUMNS = {
+    'movieId': 'movielens_id',
+    'imdbId': 'imdb_id',
+    'tmdbId': 'tmdb_id'
+}
+RAW_RATING_TABLES = ['ratings', 'links']
+# the ratings table is partitioned by ranges of the MovieLens movie id, the
+# ids above the last range are stored in a default partition
+DEFAULT_RATINGS_PARTITION_SIZE = 20000
+DEFAULT_RATINGS_PARTITION_COUNT = 10
+
+# bytes of the credits file in one range for the parallel extraction
+CREDITS_RANGE_BYTES = 4 << 20
+
+# tables which wait to be loaded, in the queue and for a connection each
+DEFAULT_LOAD_QUEUE_SIZE = 2
+
+# columns and types of the extracted movies
+MOVIE_DTYPES = {
+    'id': 'int64',
+    'title': 'object',
+    'release_date': 'object',
+    'budget': 'Int64',
+    'revenue': 'Int64',
+    'popularity': 'Float64',
+    'runtime': 'Int64',
+    'overview': 'object',
+    'original_language': 'object',
+    'belongs_to_collection': 'Int64'
+}
+
+# relation tables filled from the movie file and their columns
+MOVIE_RELATIONS = {
+    'movies_genres': ['movie_id', 'genre_id'],
+    'movies_production_companies': ['movie_id', 'production_company_id'],
+    'production_countries': ['movie_id', 'country_id'],
+    'spoken_languages': ['movie_id', 'language_id']
+}
+# relation tables which reference entities by their key (see entity_codes)
+# and the entities
+KEYED_RELATIONS = {
+    'production_countries': 'countries',
+    'spoken_languages': 'languages'
+}
+
+# keys which are used from the dictionaries in the cells of the csv files
+ENTITY_KEYS = {'id', 'name'}
+LANGUAGE_KEYS = {'iso_639_1', 'name'}
+COUNTRY_KEYS = {'iso_3166_1', 'name'}
+CREW_KEYS = {'id', 'name', 'job', 'department'}
+CAST_KEYS = {'id', 'name', 'order'}
+# keys which are used without a check, cells with dictionaries which miss one
+# of them are malformed (the job and department of a crew member are optional)
+REQUIRED_CREW_KEYS = {'id', 'name'}
+
+
+# Splits the command line arguments into positional arguments and options.
+# Returns None if an option is unknown or has no value.
+def parse_arguments(args, known_options=OPTIONS):
+    positional = []
+    options = dict()
+    i = 0
+    while i < len(args):
+        if args[i].startswith('--'):
+            name = args[i][2:]
+            if not name in known_options or i + 1 >= len(args):
+                return None
+            options[name] = args[i + 1]
+            i += 2
+        else:
+            positional.append(args[i])
+            i += 1
+    return positional, options
+
 
 def get_named_entity(x): return x.replace(' ', '_')
 
@@ -49,6 +227,32 @@ def is_positive_float(number):
     except:
         return False
 
+
+# Parses a cell containing a list of dictionaries which contain the keys of
+# required (all keys if it is None). Malformed cells are reported with their
+# row number and treated as empty.
+def parse_list_cell(value, row, column, keys, required=None):
+    if not is_valid_str(value):
+        return []
+    try:
+        return literal_parser.parse_dict_list(
+            value, keys, keys if required == None else required)
+    except ValueError as e:
+        print('Malformed cell in column', column, 'of row', row, ':', e)
+        return []
+
+
+# Parses a cell containing a single dictionary or returns None.
+def parse_dict_cell(value, row, column, keys):
+    if not is_valid_str(value):
+        return None
+    try:
+        return literal_parser.parse_dict(value, keys, keys)
+    except ValueError as e:
+        print('Malformed cell in column', column, 'of row', row, ':', e)
+        return None
+
+
 def create_connection(db_config):
     con = None
     cur = None
@@ -65,16 +269,18 @@ def create_connection(db_config):
     return con, cur
 
 def disable_triggers(schema_info, con, cur):
-    for table_name in schema_info.keys():
-        cur.execute('ALTER TABLE ' + table_name + ' DISABLE trigger ALL;')
-        con.commit()
+    with instrumentation.stage('disable_triggers'):
+        for table_name in schema_info.keys():
+            cur.execute('ALTER TABLE ' + table_name + ' DISABLE trigger ALL;')
+            con.commit()
     return
 
 
 def enable_triggers(schema_info, con, cur):
-    for table_name in schema_info.keys():
-        cur.execute('ALTER TABLE ' + table_name + ' ENABLE trigger ALL;')
-        con.commit()
+    with instrumentation.stage('enable_triggers'):
+        for table_name in schema_info.keys():
+            cur.execute('ALTER TABLE ' + table_name + ' ENABLE trigger ALL;')
+            con.commit()
     return
 
 
@@ -91,7 +297,120 @@ def create_schema(schema_info, con, cur):
         con.commit()
 
 
+# Drops the aggregate tables of an earlier load which are not built by this
+# load (see analytics_tables); they reference the other tables, which could
+# not be dropped otherwise, and would be outdated. The caller commits.
+def drop_unused_analytics_tables(schema_info, cur, schema=None):
+    tables = [
+        table for table in analytics.ANALYTICS_TABLES
+        if not table in schema_info
+    ]
+    if schema != None:
+        tables = [schema + '.' + table for table in tables]
+    if len(tables) > 0:
+        cur.execute('DROP TABLE IF EXISTS ' + ', '.join(tables) + ';')
+
+
+def create_missing_tables(schema_info, con, cur):
+    for (name, schema) in schema_info.items():
+        cur.execute("CREATE TABLE IF NOT EXISTS " + name + " " + schema + ";")
+        con.commit()
+
+
+def create_shadow_schema(shadow_schema, con, cur):
+    cur.execute('DROP SCHEMA IF EXISTS ' + shadow_schema + ' CASCADE;')
+    cur.execute('CREATE SCHEMA ' + shadow_schema + ';')
+    con.commit()
+
+
+# Unqualified table names (also in the foreign keys of the schema file) are
+# resolved in the given schema only.
+def set_search_path(schema, con, cur):
+    cur.execute('SET search_path TO ' + schema + ';')
+    con.commit()
+
+
+def analyze_tables(schema_info, con, cur):
+    for table_name in schema_info.keys():
+        cur.execute('ANALYZE ' + table_name + ';')
+        con.commit()
+
+
+# Replaces the tables of the target schema with the tables of the shadow
+# schema in one transaction, so readers either see the old or the new tables.
+def swap_shadow_tables(schema_info, shadow_schema, target_schema, con, cur):
+    cur.execute('DROP TABLE IF EXISTS ' + ', '.join(
+        [target_schema + '.' + key for key in schema_info]) + ';')
+    for table_name in schema_info.keys():
+        cur.execute('ALTER TABLE ' + shadow_schema + '.' + table_name
+                    + ' SET SCHEMA ' + target_schema + ';')
+    cur.execute('DROP SCHEMA ' + shadow_schema + ';')
+    con.commit()
+
+
+# Adds the partitions of the raw ratings table to the schema, so they are
+# created, dropped and swapped like the other tables.
+def add_rating_partitions(schema_info, partition_size, partition_count):
+    for i in range(partition_count):
+        schema_info['ratings_' + str(i)] = (
+            'partition of ratings for values from (' + str(i * partition_size)
+            + ') to (' + str((i + 1) * partition_size) + ')')
+    schema_info['ratings_default'] = 'partition of ratings default'
+    return
+
+
+# Returns empty columns for the pairs of a relation table.
+# The values of a relation are ids, or keys if keyed is True.
+def create_relation(keyed=False):
+    return (array('q'), [] if keyed else array('q'))
+
+
+def add_relation(relation, movie_id, value):
+    relation[0].append(movie_id)
+    relation[1].append(value)
+
+
+# Converts the pairs of a relation to a DataFrame with the columns of the
+# relation table. Duplicated pairs are removed.
+def get_relation_frame(relation, columns):
+    if isinstance(relation[1], array):
+        values = np.frombuffer(relation[1], dtype='int64')
+    else:
+        values = pd.array(relation[1], dtype=object)
+    return pd.DataFrame({
+        columns[0]: np.frombuffer(relation[0], dtype='int64'),
+        columns[1]: values
+    }).drop_duplicates(ignore_index=True)
+
+
+# Converts the ids of a frame, which are read as strings, and drops and
+# reports the rows without a valid id (the original movies file contains a
+# few rows with a date as id). The row numbers are kept for the error
+# messages.
+def drop_invalid_ids(df):
+    ids = pd.to_numeric(df['id'], errors='coerce')
+    invalid = (ids.isna() | (ids != ids.round())).to_numpy()
+    for row, value in df['id'][invalid].items():
+        print('Wrong id in row %d: %s' % (row, value))
+    df = df[~invalid].copy()
+    df['id'] = ids[~invalid].astype('int64')
+    return df
+
+
+# Converts the ids and numbers of the movies, which are read as strings, and
+# drops the rows without a valid id.
+def clean_movie_frame(df_movies):
+    df_movies = drop_invalid_ids(df_movies)
+    for column in MOVIE_NUMBER_COLUMNS:
+        df_movies[column] = pd.to_numeric(df_movies[column], errors='coerce')
+    return df_movies
+
+
 # Takes the DataFrame from the movie file and extract all relevant information.
+# The movies are returned as DataFrame with the columns of the movies table and
+# the relations as DataFrames of (movie id, entity id) pairs. Languages and
+# countries are returned with their ISO codes, which are mapped to ids when
+# the tables are built.
 def extract_movie_data(df_movies):
     # define columns which information is useful
     RELEVANT_COLUMNS = [
@@ -104,31 +423,29 @@ def extract_movie_data(df_movies):
     movies_reduced = df_movies[RELEVANT_COLUMNS]
 
     # extract data and create output dictonary
-    extracted_movies = dict()
+    movie_columns = {column: [] for column in MOVIE_DTYPES}
+    relations = {
+        table: create_relation(table in KEYED_RELATIONS)
+        for table in MOVIE_RELATIONS
+    }
     extracted_genres = dict()
-    extracted_languages_iso_key = dict()
-    extracted_languages_id_key = dict()
-    extracted_countries_iso_key = dict()
-    extracted_countries_id_key = dict()
+    # names of the languages and countries by ISO code in the order of their
+    # first occurrence
+    extracted_languages = dict()
+    extracted_countries = dict()
     extracted_collections = dict()
     extracted_production_companies = dict()
-    extracted_overviews = dict()
-
-    current_lang_id = 0
-    current_country_id = 0
 
     for line in movies_reduced.iterrows():
         # line[0]: line number  line[1]: content
-        id = None
-        try:
-            id = int(line[1]['id'])
-        except ValueError:
-            print('Wrong id in:', line[1])
-            continue
+        id = int(line[1]['id'])
         # add simple values
         values = dict()
-        values['title'] = line[1]['original_title']
-        values['release_date'] = line[1]['release_date']
+        values['id'] = id
+        values['title'] = line[1]['original_title'] if is_valid_str(
+            line[1]['original_title']) else None
+        values['release_date'] = line[1]['release_date'] if is_valid_str(
+            line[1]['release_date']) else None
         values['budget'] = int(line[1]['budget']) if is_positive_integer(
             line[1]['budget']) else None
         values['popularity'] = float(
@@ -138,103 +455,91 @@ def extract_movie_data(df_movies):
             line[1]['revenue']) else None
         values['runtime'] = int(line[1]['runtime']) if is_positive_integer(
             line[1]['runtime']) else None
-        values['overview'] = str(line[1]['overview']) if len(
-            str(line[1]['overview'])) > 0 else None
+        values['overview'] = line[1]['overview'] if is_valid_str(
+            line[1]['overview']) else None
 
         # add entity values
-        values['genres'] = set()
-        for genre in eval(line[1]['genres']):
+        for genre in parse_list_cell(line[1]['genres'], line[0], 'genres',
+                                     ENTITY_KEYS):
             if not genre['id'] in extracted_genres:
                 extracted_genres[genre['id']] = {'name': genre['name']}
             if genre['id'] != None:
-                values['genres'].add(genre['id'])
+                add_relation(relations['movies_genres'], id, genre['id'])
 
-        values['collection'] = None
-        if is_valid_str(line[1]['belongs_to_collection']):
-            collection = eval(line[1]['belongs_to_collection'])
+        values['belongs_to_collection'] = None
+        collection = parse_dict_cell(line[1]['belongs_to_collection'],
+                                     line[0], 'belongs_to_collection',
+                                     ENTITY_KEYS)
+        if collection != None:
             if not collection['id'] in extracted_collections:
                 extracted_collections[collection['id']] = {
                     'name': collection['name']
                 }
-            values['collection'] = collection['id']
+            values['belongs_to_collection'] = collection['id']
 
+        values['original_language'] = None
         lang = line[1]['original_language']
-        lang_id = None
-        if not lang in extracted_languages_iso_key:
-            entry = {'id': current_lang_id, 'key': lang, 'name': None}
-            extracted_languages_id_key[current_lang_id] = entry
-            extracted_languages_iso_key[lang] = entry
-            lang_id = current_lang_id
-            current_lang_id += 1
-        else:
-            lang_id = extracted_languages_iso_key[lang]['id']
-        values['original_language'] = lang_id
-
-        values['spoken_languages'] = set()
-        if is_valid_str(line[1]['spoken_languages']):
-            for lang in eval(line[1]['spoken_languages']):
-                lang_id = None
-                if not lang['iso_639_1'] in extracted_languages_iso_key:
-                    entry = {
-                        'id': current_lang_id,
-                        'key': lang['iso_639_1'],
-                        'name': lang['name']
-                    }
-                    extracted_languages_id_key[current_lang_id] = entry
-                    extracted_languages_iso_key[lang['iso_639_1']] = entry
-                    lang_id = current_lang_id
-                    current_lang_id += 1
-                else:
-                    if extracted_languages_iso_key[lang['iso_639_1']]['name'] == None:
-                        extracted_languages_iso_key[lang['iso_639_1']]['name'] = lang['name']
-                    lang_id = extracted_languages_iso_key[lang['iso_639_1']][
-                        'id']
-                if lang_id != None:
-                    values['spoken_languages'].add(lang_id)
-
-        values['production_companies'] = set()
-        if is_valid_str(line[1]['production_companies']):
-            for company in eval(line[1]['production_companies']):
-                if not company['id'] in extracted_production_companies:
-                    extracted_production_companies[company['id']] = {
-                        'name': company['name']
-                    }
-                if company['id'] != None:
-                    values['production_companies'].add(company['id'])
-
-        values['production_countries'] = set()
-        if is_valid_str(line[1]['production_countries']):
-            for country in eval(line[1]['production_countries']):
-                country_id = None
-                if not country['iso_3166_1'] in extracted_countries_iso_key:
-                    entry = {
-                        'id': current_country_id,
-                        'key': country['iso_3166_1'],
-                        'name': country['name']
-                    }
-                    extracted_countries_id_key[current_country_id] = entry
-                    extracted_countries_iso_key[country['iso_3166_1']] = entry
-                    country_id = current_country_id
-                    current_country_id += 1
-                else:
-                    country_id = extracted_countries_iso_key[country[
-                        'iso_3166_1']]['id']
-                if country_id != None:
-                    values['production_countries'].add(country_id)
-
-        extracted_movies[id] = values
-
-    return {
+        if is_valid_str(lang):
+            values['original_language'] = lang
+            if not lang in extracted_languages:
+                extracted_languages[lang] = None
+
+        for lang in parse_list_cell(line[1]['spoken_languages'], line[0],
+                                    'spoken_languages', LANGUAGE_KEYS):
+            if lang['iso_639_1'] == None:
+                continue
+            # the name is only known from the spoken languages
+            if extracted_languages.get(lang['iso_639_1']) == None:
+                extracted_languages[lang['iso_639_1']] = lang['name']
+            add_relation(relations['spoken_languages'], id, lang['iso_639_1'])
+
+        for company in parse_list_cell(line[1]['production_companies'],
+                                       line[0], 'production_companies',
+                                       ENTITY_KEYS):
+            if not company['id'] in extracted_production_companies:
+                extracted_production_companies[company['id']] = {
+                    'name': company['name']
+                }
+            if company['id'] != None:
+                add_relation(relations['movies_production_companies'], id,
+                             company['id'])
+
+        for country in parse_list_cell(line[1]['production_countries'],
+                                       line[0], 'production_countries',
+                                       COUNTRY_KEYS):
+            if country['iso_3166_1'] == None:
+                continue
+            if not country['iso_3166_1'] in extracted_countries:
+                extracted_countries[country['iso_3166_1']] = country['name']
+            add_relation(relations['production_countries'], id,
+                         country['iso_3166_1'])
+
+        for column, column_values in movie_columns.items():
+            column_values.append(values[column])
+
+    # movies whose id occurs several times are removed by the integrity
+    # check before the load
+    extracted_movies = pd.DataFrame({
+        column: pd.array(column_values, dtype=MOVIE_DTYPES[column])
+        for column, column_values in movie_columns.items()
+    })
+
+    extracted_data = {
         'extracted_movies': extracted_movies,
         'extracted_genres': extracted_genres,
-        'extracted_languages': extracted_languages_id_key,
-        'extracted_countries': extracted_countries_id_key,
+        'extracted_languages': extracted_languages,
+        'extracted_countries': extracted_countries,
         'extracted_collections': extracted_collections,
         'extracted_production_companies': extracted_production_companies
     }
+    for table, columns in MOVIE_RELATIONS.items():
+        extracted_data[table] = get_relation_frame(relations[table], columns)
+    return extracted_data
 
 
 # Takes the DataFrame from the credits file and extract all relevant information.
+# Cast and crew are returned as DataFrames with one row per person and movie.
+# The ids of the DataFrame have been converted by drop_invalid_ids.
 def extract_credits_data(df_credits):
     # define columns which information is useful
     RELEVANT_COLUMNS = ['id', 'cast', 'crew']
@@ -243,45 +548,56 @@ def extract_credits_data(df_credits):
     credits_reduced = df_credits[RELEVANT_COLUMNS]
 
     # extract data and create output dictonary
-    extracted_crew_data = dict()
-    extracted_cast_data = dict()
+    crew_movie_ids = array('q')
+    crew_person_ids = array('q')
+    crew_jobs = []
+    crew_departments = []
+    cast_movie_ids = array('q')
+    cast_person_ids = array('q')
+    cast_orders = []
     extracted_persons = dict()
     for line in credits_reduced.iterrows():
-        movie_id = None
-        try:
-            movie_id = int(line[1]['id'])
-        except ValueError:
-            print('Wrong id in:', line[1])
-            continue
+        movie_id = int(line[1]['id'])
 
-        crew = dict()
-        for person in eval(line[1]['crew']):
+        for person in parse_list_cell(line[1]['crew'], line[0], 'crew',
+                                      CREW_KEYS, REQUIRED_CREW_KEYS):
             if 'job' in person:
-                if person['job'] in crew:
-                    crew[person['job']].add(person['id'])
-                else:
-                    crew[person['job']] = set({person['id']})
+                crew_movie_ids.append(movie_id)
+                crew_person_ids.append(person['id'])
+                crew_jobs.append(person['job'])
+                crew_departments.append(person.get('department'))
             if not person['id'] in extracted_persons:
                 extracted_persons[person['id']] = person['name']
-        if len(crew.keys()) > 0:
-            extracted_crew_data[movie_id] = crew
 
-        cast = []
-        for person in eval(line[1]['cast']):
-            cast.append({'id': person['id'], 'order': person['order']})
+        for person in parse_list_cell(line[1]['cast'], line[0], 'cast',
+                                      CAST_KEYS):
+            cast_movie_ids.append(movie_id)
+            cast_person_ids.append(person['id'])
+            cast_orders.append(person['order'])
             if not person['id'] in extracted_persons:
                 extracted_persons[person['id']] = person['name']
 
-        if len(cast) > 0:
-            extracted_cast_data[movie_id] = cast
-
     return {
-        'extracted_crew_data': extracted_crew_data,
+        'extracted_crew_data':
+        pd.DataFrame({
+            'movie_id': np.frombuffer(crew_movie_ids, dtype='int64'),
+            'person_id': np.frombuffer(crew_person_ids, dtype='int64'),
+            'job': pd.Categorical(crew_jobs),
+            'department': pd.Categorical(crew_departments)
+        }).drop_duplicates(ignore_index=True),
         'extracted_persons': extracted_persons,
-        'extracted_cast_data': extracted_cast_data
+        'extracted_cast_data':
+        pd.DataFrame({
+            'movie_id': np.frombuffer(cast_movie_ids, dtype='int64'),
+            'person_id': np.frombuffer(cast_person_ids, dtype='int64'),
+            'order_id': pd.array(cast_orders, dtype='Int64')
+        })
     }
 
 
+# Returns the keywords as dictionary (id -> name) and the keywords of the
+# movies as DataFrame of (movie id, keyword id) pairs. The ids of the
+# DataFrame have been converted by drop_invalid_ids.
 def extract_keyword_data(df_keywords):
     # define columns which information is useful
     RELEVANT_COLUMNS = ['id', 'keywords']
@@ -291,319 +607,1100 @@ def extract_keyword_data(df_keywords):
 
     # extract data and create output dictonary
     extracted_keywords = dict()
+    movies_keywords = create_relation()
     for line in keywords_reduced.iterrows():
         # line[0]: line number  line[1]: content
-        movie_id = None
-        try:
-            movie_id = int(line[1]['id'])
-        except ValueError:
-            print('Wrong movie id in:', line[1])
-            continue
-        for keyword in eval(line[1]['keywords']):
+        movie_id = int(line[1]['id'])
+        for keyword in parse_list_cell(line[1]['keywords'], line[0],
+                                       'keywords', ENTITY_KEYS):
             if not keyword['id'] in extracted_keywords:
-                extracted_keywords[keyword['id']] = {
-                    'name': keyword['name'],
-                    'movies': {movie_id}
-                }
-            else:
-                extracted_keywords[keyword['id']]['movies'].add(movie_id)
-    return extracted_keywords
+                extracted_keywords[keyword['id']] = keyword['name']
+            add_relation(movies_keywords, movie_id, keyword['id'])
+    return {
+        'extracted_keywords': extracted_keywords,
+        'movies_keywords': get_relation_frame(movies_keywords,
+                                              ['movie_id', 'keyword_id'])
+    }
 
 
-def extract_rating_data(df_ratings):
+# Aggregates a DataFrame of ratings to partial aggregates (sum, count and sum
+# of squares per movie) which can be merged with merge_rating_aggregates.
+def aggregate_ratings(df_ratings):
     # define columns which information is useful
     RELEVANT_COLUMNS = ['movieId', 'rating']
 
-    # reduce data to relevant columns
-    ratings_reduced = df_ratings[RELEVANT_COLUMNS]
+    # reduce data to relevant columns and drop rows which can not be parsed
+    ratings_reduced = df_ratings[RELEVANT_COLUMNS].apply(
+        pd.to_numeric, errors='coerce')
+    valid = ratings_reduced.notna().all(axis=1)
+    if not valid.all():
+        print('Problems with parsing %d ratings' % ((~valid).sum(),))
+        ratings_reduced = ratings_reduced[valid]
+    ratings_reduced = ratings_reduced.astype(RATING_DTYPES)
+    ratings_reduced['rating'] = ratings_reduced['rating'].astype('float64')
+    ratings_reduced['squares'] = ratings_reduced['rating']**2
+
+    grouped = ratings_reduced.groupby('movieId')
+    return pd.DataFrame({
+        'sum': grouped['rating'].sum(),
+        'count': grouped['rating'].count(),
+        'squares': grouped['squares'].sum()
+    })
+
+
+def merge_rating_aggregates(aggregates, partial):
+    if aggregates is None:
+        return partial
+    return aggregates.add(partial, fill_value=0)
+
+
+# Maps the aggregates of the MovieLens movie ids to the TMDB ids of the links.
+# The aggregates of MovieLens ids which are linked to the same TMDB id are
+# combined, the aggregates of unlinked ids are dropped.
+def map_rating_aggregates(aggregates, links):
+    links = links.dropna(subset=['movielens_id', 'tmdb_id']).drop_duplicates(
+        'movielens_id')
+    tmdb_ids = pd.Series(links['tmdb_id'].to_numpy(dtype='int64'),
+                         index=links['movielens_id'].to_numpy(dtype='int64'),
+                         name='tmdb_id')
+    aggregates = aggregates.set_axis(aggregates.index.astype('int64'))
+    mapped = aggregates.join(tmdb_ids, how='inner')
+    return mapped.groupby('tmdb_id')[['sum', 'count', 'squares']].sum()
+
+
+# Computes the rating mean, count and standard deviation per movie from the
+# aggregates (std is the population standard deviation, so it is also
+# defined for movies with a single rating).
+def finalize_rating_aggregates(aggregates):
+    means = aggregates['sum'] / aggregates['count']
+    variances = (aggregates['squares'] / aggregates['count'] - means**2)
+    return pd.DataFrame({
+        'rating': means,
+        'rating_count': aggregates['count'].astype('int64'),
+        'rating_std': variances.clip(lower=0)**0.5
+    })
+
+
+# Returns the rating mean, count and standard deviation per TMDB id.
+def get_movie_ratings(rating_data, links):
+    aggregates = rating_data['extracted_rating_aggregates']
+    mapped = map_rating_aggregates(aggregates, links)
+    print('Map ratings of %d MovieLens movies to %d TMDB movies' %
+          (len(aggregates), len(mapped)))
+    return finalize_rating_aggregates(mapped)
+
+
+def get_empty_rating_aggregates():
+    return pd.DataFrame({
+        'sum': pd.Series([], dtype='float64'),
+        'count': pd.Series([], dtype='int64'),
+        'squares': pd.Series([], dtype='float64')
+    }, index=pd.Index([], dtype='int64', name='movieId'))
+
+
+# Returns the rating aggregates per MovieLens movie id; they are mapped to
+# the TMDB ids with the links before they are written to the movies.
+def extract_rating_data(df_ratings):
+    return {'extracted_rating_aggregates': aggregate_ratings(df_ratings)}
+
 
-    # extract data and create output directory
-    ratings_for_movies = defaultdict(list)
+# Reads the ratings file in chunks and folds every chunk into the running
+# aggregates, so the memory usage depends on the number of movies only.
+def stream_rating_data(ratings_path, chunk_size):
+    aggregates = None
     count = 0
-    for line in ratings_reduced.iterrows():
-        count += 1
-        if (count % 100000 == 0):
-            print('Proceed %d ratings' % (count,))
+    for chunk in csv_reader.read_csv_chunks('ratings', ratings_path,
+                                            RATING_DTYPES,
+                                            chunksize=chunk_size):
+        with instrumentation.stage('aggregate_ratings',
+                                   rows_in=len(chunk)) as record:
+            aggregates = merge_rating_aggregates(aggregates,
+                                                 aggregate_ratings(chunk))
+            record['rows_out'] = len(aggregates)
+        count += len(chunk)
+        print('Proceed %d ratings of %d movies' % (count, len(aggregates)))
+    if aggregates is None:
+        aggregates = get_empty_rating_aggregates()
+    return {'extracted_rating_aggregates': aggregates}
+
+
+def read_links(links_path):
+    links = csv_reader.read_csv('links', links_path, LINK_CSV_DTYPES)
+    return links.rename(columns=LINK_COLUMNS)[list(LINK_COLUMNS.values())]
+
+
+# Returns a function which returns the raw ratings in chunks of chunk_size
+# rows with the columns of the ratings table, so the file never has to be
+# held in memory as a whole. With rating_results, the chunks are also
+# aggregated like in stream_rating_data and the rating data (or the error of
+# the stream) is put into rating_results at the end, so the file is only read
+# once.
+def get_raw_rating_chunks(ratings_path, chunk_size, rating_results=None):
+
+    def iterate_chunks():
+        aggregates = None
         try:
-            movie_id = int(line[1]['movieId'])
-            rating = float(line[1]['rating'])
-            ratings_for_movies[movie_id].append(rating)
-        except ValueError:
-            print('Problems with parsing: ', line)
-    for key in ratings_for_movies:
-        ratings_for_movies[key] = sum(
-            ratings_for_movies[key]) / len(ratings_for_movies[key])
-    return ratings_for_movies
-
-
-def process_buffers(buffers, con, cur, batch_size):
-    for buffer, query in buffers.values():
-        if len(buffer) >= batch_size:
-            cur.executemany(query, buffer)
-            con.commit()
-            buffer.clear()
-    return
+            for chunk in csv_reader.read_csv_chunks('raw ratings',
+                                                    ratings_path,
+                                                    RAW_RATING_DTYPES,
+                                                    chunksize=chunk_size):
+                if rating_results != None:
+                    with instrumentation.stage('aggregate_ratings',
+                                               rows_in=len(chunk)) as record:
+                        aggregates = merge_rating_aggregates(
+                            aggregates,
+                            aggregate_ratings(chunk[list(RATING_DTYPES)]))
+                        record['rows_out'] = len(aggregates)
+                yield chunk.rename(columns=RAW_RATING_COLUMNS)[list(
+                    RAW_RATING_COLUMNS.values())]
+        except BaseException as error:
+            if rating_results != None:
+                rating_results.put(error)
+            raise
+        if rating_results != None:
+            if aggregates is None:
+                aggregates = get_empty_rating_aggregates()
+            rating_results.put({'extracted_rating_aggregates': aggregates})
+
+    return iterate_chunks
+
+
+# Yields the ratings table, which is streamed from the ratings file while it
+# is written (see get_raw_rating_chunks).
+def iterate_raw_rating_tables(ratings_path, chunk_size, rating_results=None):
+    yield 'ratings', get_raw_rating_chunks(ratings_path, chunk_size,
+                                           rating_results)
+
+
+# Returns the rating data which the raw ratings stream puts into
+# rating_results. The error of the stream is raised; the waiting ends with an
+# error when stop is set, i.e. the load failed before the ratings were
+# streamed.
+def wait_for_streamed_ratings(rating_results, stop=None):
+    print('Wait for the aggregates of the streamed ratings ...')
+    while True:
+        try:
+            result = rating_results.get(timeout=0.1)
+        except Empty:
+            if stop != None and stop.is_set():
+                raise RuntimeError(
+                    'The load stopped before the ratings were streamed')
+            continue
+        if isinstance(result, BaseException):
+            raise result
+        return result
 
 
-def flush_buffers(buffers, con, cur, batch_size):
-    for buffer, query in buffers.values():
-        cur.executemany(query, buffer)
-        con.commit()
-        buffer.clear()
-    return
+# Reads the used columns of the movies file. The pyarrow engine skips rows
+# with a wrong number of fields with a warning; the C engine reads them with
+# shifted values, so the rows whose id is malformed are dropped.
+def read_movie_frame(movies_path):
+    return clean_movie_frame(
+        csv_reader.read_csv('movies', movies_path, MOVIE_CSV_DTYPES,
+                            on_bad_lines='warn'))
 
 
-def get_db_literal(value):
-    if value == None:
-        return None
-    else:
-        return str(value)
-
-
-def insert_movie_meta_data(data, rating_data, con, cur, batch_size):
-
-    # query templates
-    QUERY_INSERT_MOVIES = (
-        "INSERT INTO movies (id, title, release_date, budget, "
-        + "revenue, popularity, runtime, rating, overview, original_language, "
-        + "belongs_to_collection) VALUES %s")
-    QUERY_INSERT_GENRES_RELATION = (
-        "INSERT INTO movies_genres (movie_id, genre_id) VALUES %s")
-    QUERY_INSERT_PRODUCTION_COMPANY_RELATION = (
-        "INSERT INTO movies_production_companies (movie_id, production_company_id) VALUES %s"
-    )
-    QUERY_INSERT_PRODUCTION_COUNTRIES_RELATION = (
-        "INSERT INTO production_countries (movie_id, country_id) VALUES %s")
-    QUERY_INSERT_SPOKEN_LANGUAGES_RELATION = (
-        "INSERT INTO spoken_languages (movie_id, language_id) VALUES %s")
-
-    QUERY_INSERT_GENRES = "INSERT INTO genres (id, name) VALUES %s"
-    QUERY_INSERT_COLLECTIONS = "INSERT INTO collections (id, name) VALUES %s"
-    QUERY_INSERT_PRODUCTION_COMPANIES = "INSERT INTO production_companies (id, name) VALUES %s"
-    QUERY_INSERT_COUNTRIES = "INSERT INTO countries (id, code, name) VALUES %s"
-    QUERY_INSERT_LANGUAGES = "INSERT INTO languages (id, lang_key, name) VALUES %s"
-
-    # query buffers
-    buffers = {
-        'movies_content': (list(), QUERY_INSERT_MOVIES),
-        'genres_relation': (list(), QUERY_INSERT_GENRES_RELATION),
-        'production_companies_relation':
-        (list(), QUERY_INSERT_PRODUCTION_COMPANY_RELATION),
-        'production_countries_relation':
-        (list(), QUERY_INSERT_PRODUCTION_COUNTRIES_RELATION),
-        'spoken_languages_relation': (list(),
-                                      QUERY_INSERT_SPOKEN_LANGUAGES_RELATION)
+def read_and_extract_movie_data(movies_path):
+    df_movies = read_movie_frame(movies_path)
+    print('Read', df_movies.size, 'movies')
+    print('Extract movie data from csv ...')
+    with instrumentation.stage('extract_movie_data',
+                               rows_in=len(df_movies)) as record:
+        data = extract_movie_data(df_movies)
+        record['rows_out'] = len(data['extracted_movies'])
+    return data
+
+
+# Extracts the credits of every shard_count-th byte range of the credits file
+# starting with range shard. Only the records of these ranges are parsed, so
+# the shards do not read the whole file. Returns a list of (range number,
+# extracted data).
+def read_and_extract_credits_data(credits_path, shard=0, shard_count=1):
+    results = []
+    for i, df_credits in csv_scanner.iterate_record_ranges(
+            'credits', credits_path, CREDIT_CSV_DTYPES, CREDITS_RANGE_BYTES,
+            shard, shard_count):
+        df_credits = drop_invalid_ids(df_credits)
+        with instrumentation.stage('extract_credits_data',
+                                   rows_in=len(df_credits)) as record:
+            data = extract_credits_data(df_credits)
+            record['rows_out'] = len(data['extracted_cast_data'])
+        results.append((i, data))
+    return results
+
+
+# Merges the extracted credits of several ranges in the order of the file.
+def merge_credits_data(range_results):
+    range_results = sorted(range_results, key=lambda result: result[0])
+    extracted_persons = dict()
+    for i, data in range_results:
+        for person_id, name in data['extracted_persons'].items():
+            if not person_id in extracted_persons:
+                extracted_persons[person_id] = name
+    extracted_crew_data = pd.concat(
+        [data['extracted_crew_data'] for i, data in range_results],
+        ignore_index=True)
+    extracted_crew_data['job'] = extracted_crew_data['job'].astype('category')
+    extracted_crew_data['department'] = extracted_crew_data[
+        'department'].astype('category')
+    return {
+        'extracted_crew_data': extracted_crew_data,
+        'extracted_persons': extracted_persons,
+        'extracted_cast_data': pd.concat(
+            [data['extracted_cast_data'] for i, data in range_results],
+            ignore_index=True)
     }
 
-    movies_data = data['extracted_movies']
-
-    for movie_id, movie_values in movies_data.items():
-        # keys: 'title', 'release_date', 'budget', 'popularity', 'revenue',
-        #       'runtime', 'overview', 'genres', 'collection', 'original_language',
-        #       'spoken_languages', 'production_companies', 'production_countries'
-        # DB-Columns: id, title, release_date, budget, revenue, popularity,
-        #             runtime, original_language, belongs_to_collection
-        rating = rating_data[movie_id] if movie_id in rating_data else None
-        buffers['movies_content'][0].append(
-            [(str(movie_id), get_db_literal(movie_values['title']),
-              get_db_literal(movie_values['release_date']),
-              get_db_literal(movie_values['budget']),
-              get_db_literal(movie_values['revenue']),
-              get_db_literal(movie_values['popularity']),
-              get_db_literal(movie_values['runtime']),
-              get_db_literal(rating),
-              get_db_literal(movie_values['overview']),
-              get_db_literal(movie_values['original_language']),
-              get_db_literal(movie_values['collection']))])
-        for value in movie_values['genres']:
-            buffers['genres_relation'][0].append([(str(movie_id), str(value))])
-        for value in movie_values['production_companies']:
-            buffers['production_companies_relation'][0].append([(str(movie_id),
-                                                                 str(value))])
-        for value in movie_values['production_countries']:
-            buffers['production_countries_relation'][0].append([(str(movie_id),
-                                                                 str(value))])
-        for value in movie_values['spoken_languages']:
-            buffers['spoken_languages_relation'][0].append([(str(movie_id),
-                                                             str(value))])
-        process_buffers(buffers, con, cur, batch_size)
-    flush_buffers(buffers, con, cur, batch_size)
-
-    genres_data = data['extracted_genres']
-    buffers = {'genres_content': (list(), QUERY_INSERT_GENRES)}
-    for genre_id, genre_values in genres_data.items():
-        buffers['genres_content'][0].append([(str(genre_id),
-                                              get_db_literal(
-                                                  genre_values['name']))])
-        process_buffers(buffers, con, cur, batch_size)
-    flush_buffers(buffers, con, cur, batch_size)
-
-    collections_data = data['extracted_collections']
-    buffers = {'collections_content': (list(), QUERY_INSERT_COLLECTIONS)}
-    for collection_id, collection_values in collections_data.items():
-        buffers['collections_content'][0].append(
-            [(str(collection_id), get_db_literal(collection_values['name']))])
-        process_buffers(buffers, con, cur, batch_size)
-    flush_buffers(buffers, con, cur, batch_size)
-
-    production_companies_data = data['extracted_production_companies']
-    buffers = {
-        'production_companies_content': (list(),
-                                         QUERY_INSERT_PRODUCTION_COMPANIES)
+
+def read_keyword_frame(keywords_path):
+    return drop_invalid_ids(
+        csv_reader.read_csv('keywords', keywords_path, KEYWORD_CSV_DTYPES))
+
+
+def read_and_extract_keyword_data(keywords_path):
+    df_keywords = read_keyword_frame(keywords_path)
+    print('Read', df_keywords.size, 'keyword assignments')
+    print('Extract keywords data from csv ...')
+    with instrumentation.stage('extract_keyword_data',
+                               rows_in=len(df_keywords)) as record:
+        data = extract_keyword_data(df_keywords)
+        record['rows_out'] = len(data['movies_keywords'])
+    return data
+
+
+def read_and_extract_rating_data(ratings_path, ratings_chunk_size):
+    print('Extract rating data from csv ...')
+    if ratings_chunk_size == None:
+        df_ratings = csv_reader.read_csv('ratings', ratings_path,
+                                         RATING_DTYPES)
+        print('Read', df_ratings.size, 'ratings')
+        with instrumentation.stage('extract_rating_data',
+                                   rows_in=len(df_ratings)) as record:
+            data = extract_rating_data(df_ratings)
+            record['rows_out'] = len(data['extracted_rating_aggregates'])
+        return data
+    return stream_rating_data(ratings_path, ratings_chunk_size)
+
+
+# Reads and extracts one of the csv files.
+def read_and_extract_data(name, path, ratings_chunk_size):
+    if name == 'movies':
+        return read_and_extract_movie_data(path)
+    if name == 'credits':
+        print('Extract credits data from csv ...')
+        return merge_credits_data(read_and_extract_credits_data(path))
+    if name == 'keywords':
+        return read_and_extract_keyword_data(path)
+    if name == 'links':
+        return {'extracted_links': read_links(path)}
+    return read_and_extract_rating_data(path, ratings_chunk_size)
+
+
+# Yields (name, extracted data) for the movies, credits, keywords, ratings and
+# links files in the order in which their extraction finishes. Files whose
+# extracted data is found in the parse cache (unless cache_dir is None) are
+# not read again; the data of the other files is added to the cache. With
+# rating_results, the ratings are not read here but aggregated by the raw
+# ratings stream (see get_raw_rating_chunks) and taken from rating_results
+# after the other files; stop ends the waiting for them.
+def iterate_extracted_data(movies_path, credits_path, keywords_path,
+                           ratings_path, links_path, ratings_chunk_size,
+                           workers, cache_dir=None, rating_results=None,
+                           stop=None):
+    sources = {
+        'movies': movies_path,
+        'credits': credits_path,
+        'keywords': keywords_path,
+        'ratings': ratings_path,
+        'links': links_path
     }
-    for comp_id, comp_values in production_companies_data.items():
-        buffers['production_companies_content'][0].append(
-            [(str(comp_id), get_db_literal(comp_values['name']))])
-        process_buffers(buffers, con, cur, batch_size)
-    flush_buffers(buffers, con, cur, batch_size)
-
-    countries_data = data['extracted_countries']
-    buffers = {'countries_content': (list(), QUERY_INSERT_COUNTRIES)}
-    for country_id, country_values in countries_data.items():
-        buffers['countries_content'][0].append([(str(country_id),
-                                                 get_db_literal(
-                                                     country_values['key']),
-                                                 get_db_literal(
-                                                     country_values['name']))])
-        process_buffers(buffers, con, cur, batch_size)
-    flush_buffers(buffers, con, cur, batch_size)
-
-    languages_data = data['extracted_languages']
-    buffers = {'languages_content': (list(), QUERY_INSERT_LANGUAGES)}
-    for lang_id, lang_values in languages_data.items():
-        buffers['languages_content'][0].append([(str(lang_id),
-                                                 get_db_literal(
-                                                     lang_values['key']),
-                                                 get_db_literal(
-                                                     lang_values['name']))])
-        process_buffers(buffers, con, cur, batch_size)
-    flush_buffers(buffers, con, cur, batch_size)
+    missing = []
+    for name, path in sources.items():
+        result = None
+        if cache_dir != None:
+            result = parse_cache.load_result(cache_dir, name, path)
+        if result != None:
+            print('Use cached', name, 'data')
+            yield name, result
+        else:
+            missing.append(name)
+
+    stream_ratings = 'ratings' in missing and rating_results != None
+    if stream_ratings:
+        missing.remove('ratings')
+    for name, result in iterate_new_extracted_data(sources, missing,
+                                                   ratings_chunk_size,
+                                                   workers):
+        if cache_dir != None:
+            parse_cache.store_result(cache_dir, name, sources[name], result)
+        yield name, result
+    if stream_ratings:
+        result = wait_for_streamed_ratings(rating_results, stop)
+        if cache_dir != None:
+            parse_cache.store_result(cache_dir, 'ratings', ratings_path,
+                                     result)
+        yield 'ratings', result
+
+
+# Runs the extraction of the given files. With more than one worker the
+# files are processed in parallel processes and the credits file, which takes
+# the longest, is split into shards on the remaining workers.
+def iterate_new_extracted_data(sources, names, ratings_chunk_size, workers):
+    if workers <= 1:
+        for name in names:
+            yield name, read_and_extract_data(name, sources[name],
+                                              ratings_chunk_size)
+        return
+    if len(names) == 0:
+        return
 
+    # the credits shards use the workers which are not busy with the other
+    # files (the small links file is not counted)
+    shard_count = max(
+        1, workers - len([name for name in names if name != 'links']) + 1)
+    print('Extract data with %d processes (%d credits shards) ...' %
+          (workers, shard_count))
+    # the extraction runs in the producer thread of the load while the load
+    # threads work, so the workers are spawned instead of forked (a forked
+    # process would inherit the locks of the other threads in their state)
+    run_settings = instrumentation.get_settings()
+    with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = dict()
+        for name in names:
+            if name == 'credits':
+                for shard in range(shard_count):
+                    futures[executor.submit(instrumentation.run_with_records,
+                                            run_settings,
+                                            read_and_extract_credits_data,
+                                            sources[name], shard,
+                                            shard_count)] = name
+            else:
+                futures[executor.submit(instrumentation.run_with_records,
+                                        run_settings, read_and_extract_data,
+                                        name, sources[name],
+                                        ratings_chunk_size)] = name
+        credits_results = []
+        credits_shards = 0
+        for future in as_completed(futures):
+            name = futures[future]
+            if name != 'credits':
+                yield name, get_worker_result(future)
+                continue
+            credits_results.extend(get_worker_result(future))
+            credits_shards += 1
+            if credits_shards == shard_count:
+                yield name, merge_credits_data(credits_results)
+
+
+# Returns the result of a worker started with run_with_records and adds the
+# records of the worker to the records of this process.
+def get_worker_result(future):
+    result, records = future.result()
+    instrumentation.add_records(records)
+    return result
+
+
+# Writes a DataFrame to a table in batches of batch_size rows, beginning at
+# start_row. With progress, the number of written rows (plus row_offset, the
+# rows of the table written before this DataFrame) is recorded in the
+# transaction of every batch.
+def insert_frame(table, frame, con, cur, batch_size, write, start_row=0,
+                 progress=None, row_offset=0):
+    for start in range(start_row, len(frame), batch_size):
+        batch = frame.iloc[start:start + batch_size]
+        with instrumentation.stage('flush ' + table, rows_in=len(batch)):
+            write(cur, table, batch)
+            record_step(progress, cur, 'load ' + table,
+                        row_offset + start + len(batch),
+                        row_offset + len(frame), False)
+            con.commit()
     return
 
 
-def print_all_jobs(extracted_crew_data):
-    all_jobs = [
-        item for movie_id, crew_data in extracted_crew_data.items()
-        for item in crew_data
+# Records a step of a checkpointed load (progress is None if the load is not
+# checkpointed). The caller commits the step together with its work.
+def record_step(progress, cur, step, rows_loaded=0, rows_total=0,
+                completed=True):
+    if progress != None:
+        load_progress.set_progress(progress['table'], cur, step,
+                                   progress['mode'], rows_loaded, rows_total,
+                                   completed)
+
+
+def is_step_completed(progress, step):
+    return progress != None and progress['steps'].get(step,
+                                                      (0, 0, False))[2]
+
+
+# Returns a DataFrame with the columns id and name (or the given columns) of
+# the entities of a dictionary id -> {'name': name}.
+def get_entity_frame(entity_data, columns=['id', 'name']):
+    return pd.DataFrame({
+        columns[0]: pd.array(list(entity_data.keys()), dtype='Int64'),
+        columns[1]: [values['name'] for values in entity_data.values()]
+    })
+
+
+# Returns the frame of an entity which is identified by a key, entity_data
+# maps the keys to the names. The ids are taken from the code table of the
+# entity in codes (see entity_codes).
+def get_coded_entity_frame(entity_data, key_column, codes, entity):
+    keys = list(entity_data.keys())
+    return pd.DataFrame({
+        'id': entity_codes.encode_keys(codes, entity, keys),
+        key_column: keys,
+        'name': list(entity_data.values())
+    })
+
+
+# Joins the ratings per TMDB id (see get_movie_ratings) onto the movies and
+# replaces the original languages by their ids.
+def get_movie_frame(movies_data, movie_ratings, codes):
+    movies = movies_data.copy()
+    movies['original_language'] = entity_codes.encode_keys(
+        codes, 'languages', movies['original_language'])
+    ratings = movie_ratings.reindex(movies['id'].to_numpy(dtype='int64'))
+    movies['rating'] = pd.array(ratings['rating'].to_numpy(), dtype='Float64')
+    movies['rating_count'] = pd.array(ratings['rating_count'].to_numpy(),
+                                      dtype='Int64')
+    movies['rating_std'] = pd.array(ratings['rating_std'].to_numpy(),
+                                    dtype='Float64')
+    print('%d of %d movies have ratings' %
+          (movies['rating_count'].notna().sum(), len(movies)))
+    instrumentation.set_counts(
+        'ratings', {
+            'movies': len(movies),
+            'movies_with_ratings': int(movies['rating_count'].notna().sum()),
+            'tmdb_ids_with_ratings': len(movie_ratings)
+        })
+    return movies
+
+
+# Returns the tables filled by the movie meta data (except for the movies
+# table which also needs the ratings) as a dictionary mapping the table name
+# to a DataFrame with the columns of the table.
+def get_movie_meta_data_tables(data, codes):
+    tables = {
+        'genres': get_entity_frame(data['extracted_genres']),
+        'collections': get_entity_frame(data['extracted_collections']),
+        'production_companies':
+        get_entity_frame(data['extracted_production_companies']),
+        'countries': get_coded_entity_frame(data['extracted_countries'],
+                                            'code', codes, 'countries'),
+        'languages': get_coded_entity_frame(data['extracted_languages'],
+                                            'lang_key', codes, 'languages')
+    }
+    for table, columns in MOVIE_RELATIONS.items():
+        tables[table] = data[table]
+        if table in KEYED_RELATIONS:
+            tables[table] = pd.DataFrame({
+                columns[0]: data[table][columns[0]],
+                columns[1]: entity_codes.encode_keys(
+                    codes, KEYED_RELATIONS[table], data[table][columns[1]])
+            })
+    return tables
+
+
+# Returns the crew entries whose job is selected by crew_jobs, a dictionary
+# which maps a department to a list of its jobs ('*' selects all jobs of the
+# department). All entries are selected if crew_jobs is None.
+def select_crew_jobs(crew_data, crew_jobs):
+    if crew_jobs == None:
+        return crew_data
+    selected = pd.Series(False, index=crew_data.index)
+    for department, jobs in crew_jobs.items():
+        in_department = crew_data['department'] == department
+        if '*' in jobs:
+            selected |= in_department
+        else:
+            selected |= in_department & crew_data['job'].isin(jobs)
+    return crew_data[selected]
+
+
+# Returns the departments, jobs and crew tables for the crew entries. The
+# departments are identified by their names and the jobs by their department
+# and name; their ids are taken from codes (see entity_codes), new ones are
+# numbered in the order of the names.
+def get_crew_tables(crew_data, codes):
+    crew_data = crew_data.astype({'job': object, 'department': object})
+    departments = sorted(crew_data['department'].dropna().unique())
+    department_ids = dict(
+        zip(departments,
+            entity_codes.encode_keys(codes, 'departments', departments,
+                                     first_id=1)))
+    jobs = crew_data[['department', 'job']].drop_duplicates().sort_values(
+        ['department', 'job'], na_position='last', ignore_index=True)
+    job_keys = [
+        json.dumps([
+            department if is_valid_str(department) else None,
+            job if is_valid_str(job) else None
+        ]) for department, job in zip(jobs['department'], jobs['job'])
     ]
-    print(Counter(all_jobs))
-    return
+    jobs['job_id'] = entity_codes.encode_keys(codes, 'jobs', job_keys,
+                                              first_id=1)
+    crew = crew_data.merge(jobs, on=['department', 'job'], how='left')
+    return {
+        'departments': pd.DataFrame({
+            'id': pd.array(list(department_ids.values()), dtype='Int64'),
+            'name': list(department_ids.keys())
+        }),
+        'jobs': pd.DataFrame({
+            'id': pd.array(jobs['job_id'], dtype='Int64'),
+            'name': jobs['job'],
+            'department_id': pd.array(jobs['department'].map(department_ids),
+                                      dtype='Int64')
+        }),
+        'crew': pd.DataFrame({
+            'movie_id': crew['movie_id'],
+            'person_id': crew['person_id'],
+            'job_id': crew['job_id']
+        })
+    }
 
 
-def insert_credits_data(data, con, cur, batch_size):
-    QUERY_INSERT_PERSONS = "INSERT INTO persons (id, name) VALUES %s"
-    QUERY_INSERT_DIRECTORS = "INSERT INTO directors (movie_id, director_id) VALUES %s"
-    QUERY_INSERT_ACTORS = "INSERT INTO actors (movie_id, person_id, order_id) VALUES %s"
-
-    buffers = {'persons': (list(), QUERY_INSERT_PERSONS)}
-    for person_id, person_name in data['extracted_persons'].items():
-        buffers['persons'][0].append([(str(person_id),
-                                       get_db_literal(person_name))])
-        process_buffers(buffers, con, cur, batch_size)
-    flush_buffers(buffers, con, cur, batch_size)
-
-    buffers = {'directors': (list(), QUERY_INSERT_DIRECTORS)}
-    for movie_id, crew_data in data['extracted_crew_data'].items():
-        if 'Director' in crew_data:
-            for person_id in crew_data['Director']:
-                buffers['directors'][0].append([(str(movie_id),
-                                                 str(person_id))])
-        process_buffers(buffers, con, cur, batch_size)
-    flush_buffers(buffers, con, cur, batch_size)
-
-    buffers = {'actors': (list(), QUERY_INSERT_ACTORS)}
-    for movie_id, cast_data in data['extracted_cast_data'].items():
-        for person in cast_data:
-            buffers['actors'][0].append([(str(movie_id), str(person['id']),
-                                          get_db_literal(person['order']))])
-        process_buffers(buffers, con, cur, batch_size)
-    flush_buffers(buffers, con, cur, batch_size)
+def get_job_counts(crew_data):
+    return {
+        str(job): int(count)
+        for job, count in crew_data['job'].value_counts().items()
+        if count > 0
+    }
 
-    return
 
+def get_credits_tables(data, codes, crew_jobs=None):
+    crew_data = data['extracted_crew_data']
+    directors = crew_data[crew_data['job'] == 'Director']
+    selected_crew = select_crew_jobs(crew_data, crew_jobs)
+    instrumentation.set_counts('crew_jobs', get_job_counts(selected_crew))
+    tables = {
+        'persons': pd.DataFrame({
+            'id': pd.array(list(data['extracted_persons'].keys()),
+                           dtype='Int64'),
+            'name': list(data['extracted_persons'].values())
+        }),
+        'directors': pd.DataFrame({
+            'movie_id': directors['movie_id'],
+            'director_id': directors['person_id']
+        }).drop_duplicates(ignore_index=True),
+        'actors': data['extracted_cast_data']
+    }
+    tables.update(get_crew_tables(selected_crew, codes))
+    return tables
 
-def insert_keywords(data, con, cur, batch_size):
-    QUERY_INSERT_KEYWORDS = "INSERT INTO keywords (id, keyword) VALUES %s"
-    QUERY_INSERT_MOVIES_RELATION = (
-        "INSERT INTO movies_keywords (movie_id, keyword_id) VALUES %s")
 
-    buffers = {
-        'keywords': (list(), QUERY_INSERT_KEYWORDS),
-        'movies_keywords': (list(), QUERY_INSERT_MOVIES_RELATION)
+def get_keywords_tables(data):
+    return {
+        'keywords': pd.DataFrame({
+            'id': pd.array(list(data['extracted_keywords'].keys()),
+                           dtype='Int64'),
+            'keyword': list(data['extracted_keywords'].values())
+        }),
+        'movies_keywords': data['movies_keywords']
     }
 
-    for keyword_id, values in data.items():
-        buffers['keywords'][0].append([(str(keyword_id),
-                                        get_db_literal(values['name']))])
-        for movie_id in values['movies']:
 
-            buffers['movies_keywords'][0].append([(str(movie_id),
-                                                   str(keyword_id))])
-        process_buffers(buffers, con, cur, batch_size)
-    flush_buffers(buffers, con, cur, batch_size)
+# Yields (table name, DataFrame) for every table as soon as the extracted data
+# of its file is available; the movies table is built when the movies, the
+# ratings and the links are extracted, its ids are announced to the integrity
+# check (see integrity.AnnouncedIds) as soon as the movies are extracted.
+# crew_jobs selects the jobs of the crew table. The entities without id in
+# the dataset get their ids from codes (see entity_codes), new entities are
+# added to it.
+def iterate_tables(extracted_data, crew_jobs=None, codes=None):
+    if codes == None:
+        codes = dict()
+    movie_data = None
+    rating_data = None
+    link_data = None
+    for name, data in extracted_data:
+        if name == 'movies':
+            movie_data = data
+            yield 'movies', integrity.AnnouncedIds(
+                data['extracted_movies']['id'].to_numpy(dtype='int64'))
+            tables = get_movie_meta_data_tables(data, codes)
+        elif name == 'credits':
+            tables = get_credits_tables(data, codes, crew_jobs)
+        elif name == 'keywords':
+            tables = get_keywords_tables(data)
+        elif name == 'links':
+            link_data = data
+            tables = {'links': data['extracted_links']}
+        else:
+            rating_data = data
+            tables = dict()
+        # the ratings are joined onto the movies with the links
+        if name in ('movies', 'ratings', 'links') and movie_data != None \
+                and rating_data != None and link_data != None:
+            with instrumentation.stage('join_ratings'):
+                tables['movies'] = get_movie_frame(
+                    movie_data['extracted_movies'],
+                    get_movie_ratings(rating_data,
+                                      link_data['extracted_links']), codes)
+        # the frames are only referenced by the loader once they are yielded
+        for table in list(tables.keys()):
+            yield table, tables.pop(table)
+
+
+# Writes the tables over the given connections. tables yields pairs of table
+# name and DataFrame; it is consumed by a producer thread, so the first tables
+# are written while the next ones are still extracted. If
+# respect_dependencies is set, a table is only written after all tables it
+# references in the schema.
+# At most queue_size tables wait in the queue and queue_size tables wait for a
+# connection; when both are full, the producer and with it the building of
+# the next tables is paused until a table is loaded. The extracted data of a
+# file is held as a whole until its tables are built, so the memory usage is
+# bounded by the largest files and not by the queue alone.
+# In incremental mode the rows are written to a staging table which is merged
+# into the existing table afterwards. stop is set when the load ends, also if
+# it fails.
+def load_tables(tables, schema_info, connections, batch_size, write,
+                respect_dependencies, incremental=False, progress=None,
+                queue_size=DEFAULT_LOAD_QUEUE_SIZE, stop=None):
+    dependencies = dict()
+    if respect_dependencies:
+        dependencies = load_scheduler.get_table_dependencies(schema_info)
+
+    table_queue = Queue(maxsize=queue_size)
+    if stop == None:
+        stop = threading.Event()
+    errors = []
+
+    # puts an item into the queue unless the load has been stopped
+    def put_table(item):
+        while not stop.is_set():
+            try:
+                table_queue.put(item, timeout=0.1)
+                return
+            except Full:
+                continue
+
+    def produce_tables():
+        try:
+            for table, frame in tables:
+                if stop.is_set():
+                    break
+                # tables which were loaded completely before the load was
+                # interrupted are skipped
+                if is_step_completed(progress, 'load ' + table):
+                    print('Skip', table, '(already loaded)')
+                    continue
+                put_table((table, frame))
+        except BaseException as error:
+            errors.append(error)
+        finally:
+            put_table(None)
+
+    # a table is either given as DataFrame or as function which returns the
+    # DataFrames of its chunks (e.g. the raw ratings)
+    def load_table(table, task, con, cur):
+        chunks = [task] if isinstance(task, pd.DataFrame) else task()
+        if not incremental:
+            start_row = get_resume_row(progress, table, task)
+            if start_row > 0:
+                print('Resume', table, 'at row', start_row, '...')
+            else:
+                print('Insert', table, '...')
+            with instrumentation.stage('load ' + table) as record:
+                rows = 0
+                for chunk in chunks:
+                    if rows + len(chunk) > start_row:
+                        insert_frame(table, chunk, con, cur, batch_size,
+                                     write, max(0, start_row - rows),
+                                     progress, rows)
+                    rows += len(chunk)
+                record_step(progress, cur, 'load ' + table, rows, rows)
+                con.commit()
+                record['rows_out'] = rows - start_row
+            return
+        print('Merge', table, '...')
+        staging = None
+        staging_name = delta_merge.get_staging_table_name(table)
+        with instrumentation.stage('load ' + staging_name) as record:
+            rows = 0
+            for chunk in chunks:
+                if staging == None:
+                    columns = list(chunk.columns)
+                    staging = delta_merge.create_staging_table(
+                        cur, table, columns)
+                    con.commit()
+                insert_frame(staging, chunk, con, cur, batch_size, write)
+                rows += len(chunk)
+            record['rows_out'] = rows
+        if staging == None:
+            print('No rows for', table)
+            return
+        with instrumentation.stage('merge ' + table):
+            counts = delta_merge.merge_staging_table(
+                cur, table, staging, columns,
+                deferred_constraints.parse_table_schema(schema_info[table])[1])
+            con.commit()
+        print('Merged %s: %d inserted, %d updated, %d deleted' %
+              (table, counts['inserted'], counts['updated'],
+               counts['deleted']))
 
+    producer = threading.Thread(target=produce_tables)
+    producer.start()
+    try:
+        load_scheduler.run_pipelined_load(table_queue, schema_info.keys(),
+                                          dependencies, connections,
+                                          load_table, queue_size)
+    finally:
+        stop.set()
+        producer.join()
+    if len(errors) > 0:
+        raise errors[0]
     return
 
 
-def main(argc, argv):
+# Returns the number of rows of the table which were committed before the load
+# was interrupted. The rows can only be skipped if the extracted data has the
+# same size as in the interrupted load (the size of a streamed table is only
+# known at its end).
+def get_resume_row(progress, table, task):
+    if progress == None or not 'load ' + table in progress['steps']:
+        return 0
+    rows_loaded, rows_total, completed = progress['steps']['load ' + table]
+    if isinstance(task, pd.DataFrame) and rows_total != len(task):
+        raise ValueError('The data of ' + table + ' has ' + str(len(task))
+                         + ' rows, the interrupted load had '
+                         + str(rows_total) + ' rows')
+    return rows_loaded
+
+
+def execute_statement(name, statement, con, cur):
+    with instrumentation.stage('execute ' + name):
+        cur.execute(statement)
+        con.commit()
+
+
+# Foreign keys which are violated by the loaded data stay NOT VALID; the
+# violation is reported instead of failing the finished load.
+def validate_foreign_key(name, statement, con, cur):
+    try:
+        execute_statement(name, statement, con, cur)
+    except psycopg2.Error as error:
+        con.rollback()
+        print('Foreign key ' + name + ' stays NOT VALID: '
+              + str(error).strip().split('\n')[0])
+
+
+# Builds the primary keys and indexes in parallel over the connections, adds
+# all foreign keys as NOT VALID in one transaction and validates them in
+# parallel afterwards. Steps which were completed before an interrupted load
+# are skipped, the validation is always repeated.
+def create_deferred_constraints(schema_info, connections, progress=None):
+    con, cur = connections[0]
+
+    def build_index(name, statement, con, cur):
+        with instrumentation.stage('execute ' + name):
+            cur.execute(statement)
+            record_step(progress, cur, 'execute ' + name)
+            con.commit()
+
+    print('Build primary keys and indexes ...')
+    start = time.time()
+    index_statements = deferred_constraints.get_index_statements(schema_info)
+    for name in list(index_statements.keys()):
+        if is_step_completed(progress, 'execute ' + name):
+            del index_statements[name]
+    load_scheduler.run_load(index_statements, dict(), connections,
+                            build_index)
+    print('Built primary keys and indexes in %.1f s' % (time.time() - start,))
+
+    print('Add foreign keys ...')
+    start = time.time()
+    foreign_keys = deferred_constraints.get_foreign_key_statements(
+        schema_info)
+    if not is_step_completed(progress, 'add foreign keys'):
+        for table_name, constraint_name, statement in foreign_keys:
+            cur.execute(statement)
+        record_step(progress, cur, 'add foreign keys')
+        con.commit()
+    print('Added foreign keys in %.1f s' % (time.time() - start,))
+
+    print('Validate foreign keys ...')
+    start = time.time()
+    validate_statements = dict()
+    for table_name, constraint_name, statement in foreign_keys:
+        validate_statements[constraint_name] = (
+            deferred_constraints.get_validate_statement(
+                table_name, constraint_name))
+    load_scheduler.run_load(validate_statements, dict(), connections,
+                            validate_foreign_key)
+    print('Validated foreign keys in %.1f s' % (time.time() - start,))
+    return
 
-    if argc != 2:
-        print(HELP_TEXT)
-        return
 
-    dataset_base_path = argv[1] + '/'
-    movies_path = dataset_base_path + MOVIES
-    keywords_path = dataset_base_path + KEYWORDS
-    credits_path = dataset_base_path + CREDITS
+# Yields the checked tables of the dataset in the folder dataset_base_path.
+# The tables are built from the extracted data of every file as soon as its
+# extraction is finished; crew_jobs selects the jobs (by department) of the
+# crew table, all jobs if it is null. Duplicate rows and rows referencing
+# missing ids are rejected and written to reject_file unless it is null. The
+# aggregate tables of schema_info are built from the checked tables. Only the
+# tables of schema_info are yielded. New entity codes are added to codes.
+# With raw_ratings, the rating aggregates are computed from the streamed raw
+# ratings unless they are cached or the ratings table was completely loaded
+# before (according to progress); stop ends the waiting for them if the load
+# fails.
+def iterate_dataset_tables(dataset_base_path, schema_info, db_config, workers,
+                           codes, progress=None, stop=None):
+    # ratings are streamed in chunks unless ratings_chunk_size is null
+    ratings_chunk_size = db_config.get('ratings_chunk_size',
+                                       DEFAULT_RATINGS_CHUNK_SIZE)
+    # the extracted data is cached in parse_cache_dir unless it is null
+    cache_dir = db_config.get('parse_cache_dir',
+                              parse_cache.DEFAULT_CACHE_DIR)
     ratings_path = dataset_base_path + RATINGS
+    raw_ratings = db_config.get('raw_ratings', False)
+    rating_results = None
+    if raw_ratings and not is_step_completed(progress, 'load ratings') and \
+            not (cache_dir != None and parse_cache.has_result(
+                cache_dir, 'ratings', ratings_path)):
+        rating_results = Queue()
+    tables = iterate_tables(
+        iterate_extracted_data(dataset_base_path + MOVIES,
+                               dataset_base_path + CREDITS,
+                               dataset_base_path + KEYWORDS, ratings_path,
+                               dataset_base_path + LINKS, ratings_chunk_size,
+                               workers, cache_dir, rating_results, stop),
+        db_config.get('crew_jobs'), codes)
+    if raw_ratings:
+        tables = itertools.chain(
+            iterate_raw_rating_tables(
+                ratings_path, ratings_chunk_size
+                or DEFAULT_RATINGS_CHUNK_SIZE, rating_results), tables)
+    tables = ((table, frame) for table, frame in tables
+              if table in schema_info)
+    tables = integrity.iterate_checked_tables(tables, schema_info,
+                                              db_config.get('reject_file'))
+    return analytics.iterate_analytics_tables(tables, schema_info)
 
-    df_movies = pd.read_csv(movies_path)
-    print('Read', df_movies.size, 'movies')
-    df_credits = pd.read_csv(credits_path)
-    print('Read', df_credits.size, 'credits')
-    df_keywords = pd.read_csv(keywords_path)
-    print('Read', df_keywords.size, 'keyword assignments')
-    df_ratings = pd.read_csv(ratings_path)
-    print('Read', df_ratings.size, 'ratings')
 
-    print('Extract movie data from csv ...')
-    extracted_movie_data = extract_movie_data(df_movies)
-    print('Extract credits data from csv ...')
-    extracted_credits_data = extract_credits_data(df_credits)
-    print('Extract keywords data from csv ...')
-    extracted_keywords = extract_keyword_data(df_keywords)
-    print('Extract rating data from csv ...')
-    extracted_ratings = extract_rating_data(df_ratings)
+def main(argc, argv):
+
+    arguments = parse_arguments(argv[1:])
+    if arguments == None or len(arguments[0]) != 1:
+        print(HELP_TEXT)
+        return
+    positional, options = arguments
+    try:
+        workers = int(options.get('workers', 1))
+    except ValueError:
+        print(HELP_TEXT)
+        return
+    mode = options.get('mode', MODE_FULL)
+    if not mode in MODES:
+        print(HELP_TEXT)
+        return
+    # the file sinks write a full load without a database server
+    sink = options.get('sink', table_sinks.SINK_POSTGRES)
+    if not sink in table_sinks.SINKS or (
+            sink in table_sinks.FILE_SINKS and
+        (not 'output' in options or mode != MODE_FULL)):
+        print(HELP_TEXT)
+        return
+    if sink == table_sinks.SINK_PARQUET and \
+            not table_sinks.has_parquet_support():
+        print('The parquet sink requires pyarrow')
+        return
+    report_path = options.get('report', DEFAULT_REPORT_PATH)
+    instrumentation.start_run(
+        [name for name in options.get('profile', '').split(',') if name],
+        [name for name in options.get('trace-memory', '').split(',') if name])
+
+    dataset_base_path = positional[0] + '/'
 
-    print('Connect to database ...')
     f_db_config = open(DB_CONFIG_PATH, 'r')
     db_config = json.loads(f_db_config.read())
     f_db_config.close()
 
-    con, cur = create_connection(db_config)
-
-    batch_size = db_config['batch_size']
-
     # get schema
     print('Read schema file ...')
     schema_file = open(TABLE_SCHEMA_FILE, 'r')
     schema_info = json.load(schema_file)
     schema_file.close()
-    print('Create Schema ...')
-    create_schema(schema_info, con, cur)
-
-    print('Insert data into database ...')
-    disable_triggers(schema_info, con, cur)
-    print('Insert movie meta data ...')
-    insert_movie_meta_data(extracted_movie_data,
-                           extracted_ratings, con, cur, batch_size)
-    print('Insert credits data ...')
-    insert_credits_data(extracted_credits_data, con, cur, batch_size)
-    print('Insert keywords data ...')
-    insert_keywords(extracted_keywords, con, cur, batch_size)
-    enable_triggers(schema_info, con, cur)
 
+    # the raw ratings are streamed into the partitioned ratings table and the
+    # links table is written only with raw_ratings
+    raw_ratings = db_config.get('raw_ratings', False)
+    if raw_ratings:
+        add_rating_partitions(
+            schema_info,
+            db_config.get('ratings_partition_size',
+                          DEFAULT_RATINGS_PARTITION_SIZE),
+            db_config.get('ratings_partition_count',
+                          DEFAULT_RATINGS_PARTITION_COUNT))
+    else:
+        for table in RAW_RATING_TABLES:
+            schema_info.pop(table, None)
+    # the aggregate tables are only built with analytics_tables
+    if not db_config.get('analytics_tables', False):
+        for table in analytics.ANALYTICS_TABLES:
+            schema_info.pop(table, None)
+
+    # the ids of the entities which are identified by a key are kept in
+    # entity_codes_file between the runs unless it is null; the file is
+    # updated after a successful load
+    codes_path = db_config.get('entity_codes_file',
+                               entity_codes.DEFAULT_CODES_FILE)
+    codes = entity_codes.read_codes(codes_path)
+
+    if sink != table_sinks.SINK_POSTGRES:
+        print('Extract data and export it to', options['output'], '...')
+        start = time.time()
+        table_sinks.write_tables(
+            sink,
+            iterate_dataset_tables(dataset_base_path, schema_info, db_config,
+                                   workers, codes), schema_info,
+            options['output'])
+        print('Extracted and exported tables in %.1f s' %
+              (time.time() - start, ))
+        entity_codes.write_codes(codes_path, codes)
+        print('Write run report to', report_path, '...')
+        instrumentation.write_report(report_path, {
+            'mode': mode,
+            'sink': sink,
+            'output': options['output'],
+            'workers': workers
+        })
+        print('Done.')
+        return
+
+    print('Connect to database ...')
+    con, cur = create_connection(db_config)
+
+    batch_size = db_config['batch_size']
+
+    # executemany is still available as fallback if COPY can not be used
+    write = bulk_writer.create_write_engine(
+        db_config.get('write_engine', bulk_writer.DEFAULT_ENGINE))
+    # the tables are written over load_connections connections in parallel
+    connections = [(con, cur)] + [
+        create_connection(db_config)
+        for i in range(db_config.get('load_connections', 1) - 1)
+    ]
+
+    # full and shadow loads record their progress in the target schema, so
+    # they can be continued with the resume mode after an interruption
+    target_schema = db_config.get('target_schema', DEFAULT_TARGET_SCHEMA)
+    shadow_schema = db_config.get('shadow_schema', DEFAULT_SHADOW_SCHEMA)
+    progress_table = load_progress.get_progress_table_name(target_schema)
+    resume = mode == MODE_RESUME
+    progress = None
+    if resume:
+        if not load_progress.has_progress_table(progress_table, cur):
+            print('No interrupted load found in schema', target_schema)
+            for extra_con, extra_cur in connections:
+                extra_con.close()
+            return
+        mode, steps = load_progress.read_progress(progress_table, cur)
+        progress = {'table': progress_table, 'mode': mode, 'steps': steps}
+        if not (is_step_completed(progress, 'create schema')
+                or is_step_completed(progress, 'create bare schema')):
+            print('The interrupted load did not create its tables, '
+                  + 'start a new load instead')
+            for extra_con, extra_cur in connections:
+                extra_con.close()
+            return
+        print('Resume interrupted', mode, 'load ...')
+    elif mode != MODE_INCREMENTAL:
+        load_progress.create_progress_table(progress_table, con, cur)
+        progress = {'table': progress_table, 'mode': mode, 'steps': dict()}
+
+    # in shadow mode all connections work on the tables of the shadow schema
+    # until they are swapped into the target schema
+    if mode == MODE_SHADOW:
+        if not resume:
+            print('Create shadow schema', shadow_schema, '...')
+            create_shadow_schema(shadow_schema, con, cur)
+        for shadow_con, shadow_cur in connections:
+            set_search_path(shadow_schema, shadow_con, shadow_cur)
+
+    # with defer_constraints the tables are created without primary and
+    # foreign keys, which are added after the load; a resumed load keeps the
+    # setting of the interrupted load
+    incremental = mode == MODE_INCREMENTAL
+    if resume:
+        defer_constraints = is_step_completed(progress, 'create bare schema')
+    else:
+        defer_constraints = db_config.get('defer_constraints',
+                                          False) and not incremental
+    if mode == MODE_FULL and not resume:
+        drop_unused_analytics_tables(schema_info, cur)
+    if incremental:
+        print('Create missing tables ...')
+        create_missing_tables(schema_info, con, cur)
+    elif resume:
+        print('Keep the tables of the interrupted load ...')
+    elif defer_constraints:
+        print('Create Schema without constraints ...')
+        create_schema(deferred_constraints.get_bare_schema_info(schema_info),
+                      con, cur)
+        record_step(progress, cur, 'create bare schema')
+        con.commit()
+    else:
+        print('Create Schema ...')
+        create_schema(schema_info, con, cur)
+        record_step(progress, cur, 'create schema')
+        con.commit()
+
+    # if the triggers stay enabled, referenced tables are loaded first (the
+    # merges of the incremental mode also delete rows, so they always run
+    # with disabled triggers); bare tables have no foreign key triggers
+    triggers_disabled = (db_config.get('disable_triggers', True)
+                         or incremental) and not defer_constraints
+    # the producer of the tables stops waiting for the streamed ratings when
+    # the load fails
+    stop = threading.Event()
+    tables = iterate_dataset_tables(dataset_base_path, schema_info,
+                                    db_config, workers, codes, progress, stop)
+
+    print('Extract and insert data into database ...')
+    start = time.time()
+    if triggers_disabled:
+        disable_triggers(schema_info, con, cur)
+    load_tables(tables, schema_info, connections, batch_size, write,
+                not triggers_disabled and not defer_constraints, incremental,
+                progress,
+                db_config.get('load_queue_size', DEFAULT_LOAD_QUEUE_SIZE),
+                stop)
+    if triggers_disabled:
+        enable_triggers(schema_info, con, cur)
+    print('Extracted and loaded tables in %.1f s' % (time.time() - start,))
+
+    if defer_constraints:
+        create_deferred_constraints(schema_info, connections, progress)
+    for table, statement in analytics.get_index_statements(schema_info):
+        print('Create search index of', table, '...')
+        execute_statement(table + ' index', statement, con, cur)
+
+    # the progress table is dropped in the transaction which swaps the shadow
+    # tables, or after the last step of a full load
+    if mode == MODE_SHADOW:
+        print('Analyze shadow tables ...')
+        analyze_tables(schema_info, con, cur)
+        print('Swap shadow tables into schema', target_schema, '...')
+        load_progress.drop_progress_table(progress_table, cur)
+        drop_unused_analytics_tables(schema_info, cur, target_schema)
+        swap_shadow_tables(schema_info, shadow_schema, target_schema, con,
+                           cur)
+    elif progress != None:
+        load_progress.drop_progress_table(progress_table, cur)
+        con.commit()
+    for extra_con, extra_cur in connections[1:]:
+        extra_con.close()
+    entity_codes.write_codes(codes_path, codes)
+
+    print('Write run report to', report_path, '...')
+    instrumentation.write_report(report_path, {
+        'mode': mode,
+        'resumed': resume,
+        'workers': workers,
+        'write_engine': db_config.get('write_engine',
+                                      bulk_writer.DEFAULT_ENGINE)
+    })
     print('Done.')
 
 
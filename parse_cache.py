@@ -0,0 +1,186 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import json
+import time
+import pickle
+import hashlib
+
+import instrumentation
+
+# On-disk cache of the extracted data of the csv files. Every entry belongs to
+# one source file and is valid as long as the file has the same size and
+# modification time; if only the modification time changed (e.g. the file was
+# copied or touched) the content hash decides. The extracted DataFrames are
+# stored with pickle protocol 5 which writes their column blocks as raw
+# buffers.
+
+HELP_TEXT = ('USAGE: \033[1mparse_cache.py\033[0m inspect|clear '
+             + '[cache_dir] [entry ...]\n'
+             + '\tinspect: list the cached entries and whether their source '
+             + 'files are unchanged\n'
+             + '\tclear: delete the given entries (default: all entries)\n'
+             + '\tcache_dir: folder of the cache (default: .parse_cache)')
+
+DEFAULT_CACHE_DIR = '.parse_cache'
+MANIFEST_FILE = 'manifest.json'
+
+# has to be increased whenever the extracted data changes its structure, so
+# entries which were written by an older version are not used
+CACHE_VERSION = 6
+
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def get_manifest_path(cache_dir):
+    return os.path.join(cache_dir, MANIFEST_FILE)
+
+
+def get_entry_path(cache_dir, name):
+    return os.path.join(cache_dir, name + '.pickle')
+
+
+def read_manifest(cache_dir):
+    path = get_manifest_path(cache_dir)
+    if not os.path.exists(path):
+        return dict()
+    f_manifest = open(path, 'r')
+    manifest = json.loads(f_manifest.read())
+    f_manifest.close()
+    return manifest
+
+
+def write_manifest(cache_dir, manifest):
+    path = get_manifest_path(cache_dir)
+    f_manifest = open(path + '.tmp', 'w')
+    f_manifest.write(json.dumps(manifest, indent=2))
+    f_manifest.close()
+    os.replace(path + '.tmp', path)
+
+
+def get_file_hash(path):
+    file_hash = hashlib.blake2b()
+    f_source = open(path, 'rb')
+    block = f_source.read(HASH_BLOCK_SIZE)
+    while len(block) > 0:
+        file_hash.update(block)
+        block = f_source.read(HASH_BLOCK_SIZE)
+    f_source.close()
+    return file_hash.hexdigest()
+
+
+def get_fingerprint(path, with_hash=True):
+    stat = os.stat(path)
+    fingerprint = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if with_hash:
+        fingerprint['hash'] = get_file_hash(path)
+    return fingerprint
+
+
+# Returns None if the entry matches the source file, else the reason why it
+# is outdated. The hash of the file is only computed if the size matches but
+# the modification time does not.
+def get_outdated_reason(entry, source_path):
+    if entry.get('version') != CACHE_VERSION:
+        return 'written by another cache version'
+    if os.path.abspath(source_path) != entry['source']:
+        return 'different source file'
+    if not os.path.exists(source_path):
+        return 'source file is missing'
+    fingerprint = get_fingerprint(source_path, with_hash=False)
+    if fingerprint['size'] != entry['size']:
+        return 'source file size changed'
+    if fingerprint['mtime_ns'] != entry['mtime_ns'] and get_file_hash(
+            source_path) != entry['hash']:
+        return 'source file content changed'
+    return None
+
+
+# Returns True if there is a valid entry for the source file.
+def has_result(cache_dir, name, source_path):
+    entry = read_manifest(cache_dir).get(name)
+    return (entry != None
+            and os.path.exists(get_entry_path(cache_dir, name))
+            and get_outdated_reason(entry, source_path) == None)
+
+
+# Returns the cached data of the entry or None if there is no valid entry for
+# the source file.
+def load_result(cache_dir, name, source_path):
+    manifest = read_manifest(cache_dir)
+    entry = manifest.get(name)
+    if entry == None or not os.path.exists(get_entry_path(cache_dir, name)):
+        return None
+    reason = get_outdated_reason(entry, source_path)
+    if reason != None:
+        print('Cached', name, 'data is outdated:', reason)
+        return None
+    with instrumentation.stage('load cache ' + name):
+        f_entry = open(get_entry_path(cache_dir, name), 'rb')
+        result = pickle.load(f_entry)
+        f_entry.close()
+    # remember the new modification time of a file with unchanged content
+    if os.stat(source_path).st_mtime_ns != entry['mtime_ns']:
+        entry['mtime_ns'] = os.stat(source_path).st_mtime_ns
+        write_manifest(cache_dir, manifest)
+    return result
+
+
+def store_result(cache_dir, name, source_path, result):
+    os.makedirs(cache_dir, exist_ok=True)
+    entry_path = get_entry_path(cache_dir, name)
+    with instrumentation.stage('store cache ' + name):
+        f_entry = open(entry_path + '.tmp', 'wb')
+        pickle.dump(result, f_entry, protocol=5)
+        f_entry.close()
+        os.replace(entry_path + '.tmp', entry_path)
+    entry = get_fingerprint(source_path)
+    entry['source'] = os.path.abspath(source_path)
+    entry['version'] = CACHE_VERSION
+    entry['created'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    entry['bytes'] = os.path.getsize(entry_path)
+    manifest = read_manifest(cache_dir)
+    manifest[name] = entry
+    write_manifest(cache_dir, manifest)
+
+
+def inspect_cache(cache_dir):
+    manifest = read_manifest(cache_dir)
+    if len(manifest) == 0:
+        print('The cache in', cache_dir, 'is empty')
+    for name, entry in manifest.items():
+        reason = get_outdated_reason(entry, entry['source'])
+        print('%s: %s (%.1f MB, created %s, hash %s) %s' %
+              (name, entry['source'], entry['bytes'] / (1024 * 1024),
+               entry['created'], entry['hash'][:16],
+               'valid' if reason == None else 'outdated: ' + reason))
+
+
+def clear_cache(cache_dir, names=None):
+    manifest = read_manifest(cache_dir)
+    if names == None or len(names) == 0:
+        names = list(manifest.keys())
+    for name in names:
+        if os.path.exists(get_entry_path(cache_dir, name)):
+            os.remove(get_entry_path(cache_dir, name))
+        if name in manifest:
+            del manifest[name]
+            print('Removed', name, 'from the cache')
+    if os.path.exists(cache_dir):
+        write_manifest(cache_dir, manifest)
+
+
+def main(argc, argv):
+    if argc < 2 or not argv[1] in ('inspect', 'clear'):
+        print(HELP_TEXT)
+        return
+    cache_dir = argv[2] if argc > 2 else DEFAULT_CACHE_DIR
+    if argv[1] == 'inspect':
+        inspect_cache(cache_dir)
+    else:
+        clear_cache(cache_dir, argv[3:])
+
+
+if __name__ == "__main__":
+    main(len(sys.argv), sys.argv)
@@ -0,0 +1,170 @@
+#!/usr/bin/python3
+
+import os
+import re
+import sqlite3
+
+import pandas as pd
+
+import analytics
+import bulk_writer
+import deferred_constraints
+import instrumentation
+
+# Sinks which write the tables of db_schema.json without a database server:
+# Parquet files, csv files which can be loaded with COPY, or a SQLite
+# database. Every sink is a pair of functions write(table, frame), which is
+# called for every table or chunk of a streamed table, and close(). The
+# tables are written in the order in which they arrive, so every table is
+# written in a single pass.
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+SINK_POSTGRES = 'postgres'
+SINK_PARQUET = 'parquet'
+SINK_CSV = 'csv'
+SINK_SQLITE = 'sqlite'
+FILE_SINKS = [SINK_PARQUET, SINK_CSV, SINK_SQLITE]
+SINKS = [SINK_POSTGRES] + FILE_SINKS
+
+# psql script of the csv sink which creates the tables and loads the files
+CSV_LOAD_SCRIPT = 'load.sql'
+
+SERIAL_PATTERN = re.compile(r'\bserial\b', re.IGNORECASE)
+
+
+def has_parquet_support():
+    return pq != None
+
+
+def get_file_path(output_path, table, extension):
+    return os.path.join(output_path, table + '.' + extension)
+
+
+# Writes every table to <table>.parquet. Chunks of streamed tables are
+# written as row groups of the same file.
+def create_parquet_sink(output_path, schema_info):
+    os.makedirs(output_path, exist_ok=True)
+    writers = dict()
+
+    def write(table, frame):
+        if not table in writers:
+            data = pa.Table.from_pandas(frame, preserve_index=False)
+            writers[table] = pq.ParquetWriter(
+                get_file_path(output_path, table, 'parquet'), data.schema)
+        else:
+            data = pa.Table.from_pandas(frame,
+                                        schema=writers[table].schema,
+                                        preserve_index=False)
+        writers[table].write_table(data)
+
+    def close():
+        for writer in writers.values():
+            writer.close()
+
+    return write, close
+
+
+def get_copy_command(table, columns):
+    return ('\\copy ' + table + ' (' + ', '.join(columns) + ") FROM '"
+            + table + ".csv' WITH (FORMAT csv, HEADER true, NULL '"
+            + bulk_writer.CSV_NULL + "')")
+
+
+# Writes every table to <table>.csv in the format of the copy write engine
+# (with a header). The psql script load.sql creates the tables and loads the
+# files in the order of db_schema.json, so the referenced tables are loaded
+# first, and creates the indexes of the aggregate tables; it has to be run in
+# the output folder.
+def create_csv_sink(output_path, schema_info):
+    os.makedirs(output_path, exist_ok=True)
+    written_columns = dict()
+
+    def write(table, frame):
+        first = not table in written_columns
+        frame.to_csv(get_file_path(output_path, table, 'csv'),
+                     mode='w' if first else 'a', header=first, index=False,
+                     na_rep=bulk_writer.CSV_NULL)
+        if first:
+            written_columns[table] = list(frame.columns)
+
+    def close():
+        lines = ['\\set ON_ERROR_STOP on', 'BEGIN;',
+                 'DROP TABLE IF EXISTS ' + ', '.join(schema_info) + ';']
+        for name, schema in schema_info.items():
+            lines.append('CREATE TABLE ' + name + ' ' + schema + ';')
+        for name in schema_info:
+            if name in written_columns:
+                lines.append(get_copy_command(name, written_columns[name]))
+        for name, statement in analytics.get_index_statements(schema_info):
+            lines.append(statement)
+        lines.append('COMMIT;')
+        f_script = open(os.path.join(output_path, CSV_LOAD_SCRIPT), 'w')
+        f_script.write('\n'.join(lines) + '\n')
+        f_script.close()
+
+    return write, close
+
+
+# Returns the table definition for SQLite: serial columns become integer
+# columns (an integer primary key is filled automatically) and table options
+# like partitioning are dropped. Partitions of other tables return None.
+def get_sqlite_table_schema(table_schema):
+    columns, options = deferred_constraints.split_table_options(table_schema)
+    if len(columns) == 0:
+        return None
+    return '(' + SERIAL_PATTERN.sub('integer', columns) + ')'
+
+
+# Writes the tables to a SQLite database, the existing tables are replaced.
+# All tables are written in one transaction without a journal; the foreign
+# keys are not enforced, like in a load with disabled triggers.
+def create_sqlite_sink(output_path, schema_info):
+    con = sqlite3.connect(output_path)
+    cur = con.cursor()
+    cur.execute('PRAGMA journal_mode = OFF;')
+    cur.execute('PRAGMA synchronous = OFF;')
+    for name, schema in schema_info.items():
+        sqlite_schema = get_sqlite_table_schema(schema)
+        if sqlite_schema != None:
+            cur.execute('DROP TABLE IF EXISTS ' + name + ';')
+            cur.execute('CREATE TABLE ' + name + ' ' + sqlite_schema + ';')
+
+    def write(table, frame):
+        cur.executemany(
+            bulk_writer.get_insert_query(table, list(frame.columns)).replace(
+                '%s', '?'), bulk_writer.get_frame_rows(frame))
+
+    def close():
+        con.commit()
+        con.close()
+
+    return write, close
+
+
+def create_sink(sink_name, output_path, schema_info):
+    if sink_name == SINK_PARQUET:
+        return create_parquet_sink(output_path, schema_info)
+    if sink_name == SINK_CSV:
+        return create_csv_sink(output_path, schema_info)
+    if sink_name == SINK_SQLITE:
+        return create_sqlite_sink(output_path, schema_info)
+    raise ValueError('Unknown sink: ' + str(sink_name))
+
+
+# Writes the tables (pairs of table name and DataFrame, or a function which
+# returns the chunks of a streamed table) to the file sink.
+def write_tables(sink_name, tables, schema_info, output_path):
+    write, close = create_sink(sink_name, output_path, schema_info)
+    for table, task in tables:
+        print('Export', table, '...')
+        chunks = [task] if isinstance(task, pd.DataFrame) else task()
+        for chunk in chunks:
+            with instrumentation.stage('export ' + table, rows_in=len(chunk)):
+                write(table, chunk)
+    close()